@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime
+
+import generate as gen
+
+# ==========================================
+# 生成流程基准测试: 合成 T0-T3 工作簿 (与解析器预期的版式一致), 分阶段计时, 结果存为 JSON
+# 用法: python bench.py --breaks 300 --zips 20000 --out bench.json --compare baseline.json
+# ==========================================
+
+STAGES = ("read_workbook", "extract_fuel_rate", "load_gofo_zip_db", "extract_prices",
+          "encode_bundle", "json_serialize", "html_write")
+
+# ==========================================
+# 1. 合成工作簿
+# ==========================================
+XL_BLOCKS = (("AH 大件", 150), ("OS 大件", 150), ("OM 超限", 200))
+STATES = ("CA", "NY", "TX", "IL", "NJ", "WA", "FL", "GA", "PA", "OH")
+REGIONS = ("WE", "EA", "CE")
+
+def _zone_sheet(rnd, breaks, unit=""):
+    # 标准价格表: 表头 Weight + Zone 2-8, 价格混用 "$x.xx" 字符串与数值, 末尾带备注行
+    rows = [["Weight(lb)"] + [f"Zone {z}" for z in range(2, 9)]]
+    for i in range(1, breaks + 1):
+        w = f"{i}{unit}" if unit else (i if i % 7 else f"{i} lb")
+        rows.append([w] + [f"${3 + i * 0.37 + z * 0.5 + rnd.random():.2f}" if (i + z) % 11
+                           else round(3 + i * 0.37 + z, 2) for z in range(2, 9)])
+    rows.append(["备注: 以上价格不含燃油"] + [None] * 7)
+    return rows
+
+def _place(grid, rows, top, left):
+    for r, row in enumerate(rows):
+        for c, v in enumerate(row):
+            grid[top + r][left + c] = v
+
+def make_tier_workbook(path, breaks=100, zips=5000, seed=0, zip_left=False):
+    import pandas as pd
+    rnd = random.Random(seed)
+    sheets = {}
+
+    # GOFO-报价: 左侧价格表, 右侧 目的地邮编/城市/省州/GOFO_大区 邮编库 (zip_left 时左右互换)
+    price = _zone_sheet(rnd, breaks)
+    zip_rows = [["目的地邮编", "城市", "省州", "GOFO_大区"]]
+    for i in range(zips):
+        z = rnd.randint(500, 99999)
+        zip_rows.append([z if i % 3 else f"{z:05d}", f"City{i % 2000}", rnd.choice(STATES), rnd.choice(REGIONS)])
+    grid = [[None] * 14 for _ in range(max(len(price), len(zip_rows)) + 2)]
+    grid[0][0] = "说明"
+    _place(grid, price, 1, 5 if zip_left else 0)
+    _place(grid, zip_rows, 1, 0 if zip_left else 10)
+    sheets["GOFO-报价"] = grid
+
+    # GOFO-UNIUNI-MT: 首行燃油附加费, 左右两张表 (左 lb, 右 oz)
+    left, right = _zone_sheet(rnd, breaks), _zone_sheet(rnd, max(breaks // 2, 1), "oz")
+    grid = [[None] * 18 for _ in range(max(len(left), len(right)) + 1)]
+    grid[0][0], grid[0][1] = "燃油附加费", "16.5%"
+    _place(grid, left, 1, 0)
+    _place(grid, right, 1, 9)
+    sheets["GOFO-UNIUNI-MT-报价"] = grid
+
+    sheets["USPS-YSD-报价"] = _zone_sheet(rnd, breaks, "oz")
+    for name in ("FedEx-632-MT-报价", "FedEx-MT-超大包裹-报价", "FedEx-ECO-MT报价", "FedEx-MT-危险品-报价", "GOFO大件-MT-报价"):
+        sheets[name] = [["燃油附加费", 0.16] + [None] * 6, [None] * 8] + _zone_sheet(rnd, breaks)
+
+    # XLmiles: Service 列只在每段首行填写, 重量为 "0<重量<=N" 区间
+    xl = [["Service", "desc", "Weight", "Zone 1", "Zone 2", "Zone 3", "Zone 6"]]
+    step = max(1, 130 // max(breaks, 1))
+    for svc, top in XL_BLOCKS:
+        for k, w in enumerate(range(70, top + 1, step)):
+            xl.append([svc if k == 0 else None, "", f"0<重量<={w}", f"${20 + w * 0.3:.2f}",
+                       22 + w * 0.3, 25 + w * 0.3, 30 + w * 0.3])
+    sheets["XLmiles-报价"] = xl
+
+    with pd.ExcelWriter(path) as writer:
+        for name, rows in sheets.items():
+            pd.DataFrame(rows).to_excel(writer, sheet_name=name, header=False, index=False)
+
+# ==========================================
+# 2. 分阶段计时
+# ==========================================
+def timed(fn, repeat):
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return times, result
+
+def _summary(times, **extra):
+    return dict({"min": min(times), "median": statistics.median(times), "runs": len(times)}, **extra)
+
+def run_benchmark(tiers, repeat=3):
+    # 在当前目录 (含 data/) 下逐阶段计时, 各阶段输入取上一阶段结果
+    results = {}
+    books = {}
+
+    def read_all():
+        for wb in books.values(): wb.close()
+        books.clear()
+        for tier in tiers:
+            wb = gen.TierWorkbook(os.path.join(gen.DATA_DIR, gen.TIER_FILES[tier]))
+            for ch in gen.CHANNEL_CONFIG:
+                sheet = wb.channel_sheet(ch)
+                if sheet: wb.sheet(sheet)
+            books[tier] = wb
+        return sum(len(wb.parse_counts) for wb in books.values())
+    times, sheets = timed(read_all, repeat)
+    results["read_workbook"] = _summary(times, sheets=sheets)
+
+    times, _ = timed(lambda: [gen.extract_fuel_rate(wb) for wb in books.values()], repeat)
+    results["extract_fuel_rate"] = _summary(times)
+
+    zip_wb = books[gen.GOFO_ZIP_TIER] if gen.GOFO_ZIP_TIER in books else next(iter(books.values()))
+    times, zip_db = timed(lambda: gen.load_gofo_zip_db(zip_wb), repeat)
+    results["load_gofo_zip_db"] = _summary(times, rows=len(zip_db["zip"]))
+
+    def extract_all():
+        out = {}
+        for tier, wb in books.items():
+            out[tier] = {}
+            for ch, conf in gen.CHANNEL_CONFIG.items():
+                sheet = wb.channel_sheet(ch)
+                if not sheet: continue
+                prices = gen.extract_prices(wb.sheet(sheet), split_side=conf.get("sheet_side"), channel_name=ch)
+                if prices: out[tier][ch] = {"prices": prices, "fuel_rate": 0}
+        return out
+    times, tier_data = timed(extract_all, repeat)
+    results["extract_prices"] = _summary(times, rows=sum(len(v["prices"]) for t in tier_data.values() for v in t.values()))
+    for wb in books.values(): wb.close()
+    check_gofo_prices(next(t for t, wb in books.items() if wb is zip_wb), tier_data)
+
+    def encode():
+        final_data = {
+            "warehouses": gen.WAREHOUSE_DB, "channels": gen.CHANNEL_CONFIG,
+            "gofo_zips": gen.encode_zip_db(zip_db),
+            "fedex_das": gen.encode_das({}),
+            "zone_tables": gen.build_zone_tables(gen.WAREHOUSE_DB, zip_db),
+            "tiers": {tier: gen.encode_tier_data(v) for tier, v in tier_data.items()},
+        }
+        return gen.split_bundle(final_data)
+    times, (shell, shards) = timed(encode, repeat)
+    results["encode_bundle"] = _summary(times, shards=len(shards))
+
+    times, bodies = timed(lambda: {name: gen.bundle_json(obj) for name, obj in shards.items()}, repeat)
+    results["json_serialize"] = _summary(times, bytes=sum(len(b.encode("utf-8")) for b in bodies.values()))
+
+    def write():
+        # 分片按内容哈希跳过已存在的文件, 每轮先清空以计入完整写出与压缩
+        shutil.rmtree(os.path.join(gen.OUTPUT_DIR, gen.SHARD_DIR), ignore_errors=True)
+        page = dict(shell, shards=gen.write_shards(shards))
+        return gen.write_html(os.path.join(gen.OUTPUT_DIR, "index.html"), page)
+    os.makedirs(gen.OUTPUT_DIR, exist_ok=True)
+    times, size = timed(write, repeat)
+    results["html_write"] = _summary(times, bytes=size)
+    return results
+
+def check_gofo_prices(tier, tier_data):
+    # 邮编库流式读取时顺带交给 wb 的 GOFO 价格表须与整表读取的结果一致, 否则计时无意义
+    wb = gen.TierWorkbook(os.path.join(gen.DATA_DIR, gen.TIER_FILES[tier]))
+    try:
+        sheet = wb.channel_sheet("GOFO-报价")
+        expected = gen.extract_prices(wb.sheet(sheet), channel_name="GOFO-报价") if sheet else None
+    finally:
+        wb.close()
+    got = tier_data.get(tier, {}).get("GOFO-报价", {}).get("prices")
+    if got != expected:
+        raise SystemExit(f"GOFO prices of {tier} differ from a full-sheet read "
+                         f"({len(got or [])} vs {len(expected or [])} rows)")
+
+# ==========================================
+# 3. 结果记录与对比
+# ==========================================
+def _git_commit():
+    try:
+        out = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                      cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline, threshold):
+    # 按各阶段最短耗时对比, 超过 threshold 倍记为回归
+    regressions = []
+    print(f"\n{'stage':<20}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name in STAGES:
+        if name not in current["stages"] or name not in baseline.get("stages", {}): continue
+        old, new = baseline["stages"][name]["min"], current["stages"][name]["min"]
+        ratio = new / old if old > 0 else float("inf")
+        flag = "  <-- regression" if ratio > threshold else ""
+        print(f"{name:<20}{old * 1000:>10.1f}ms{new * 1000:>10.1f}ms{ratio:>8.2f}{flag}")
+        if flag: regressions.append(name)
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="生成流程分阶段基准测试 (合成工作簿)")
+    parser.add_argument("--breaks", type=int, default=100, help="每张价格表的重量档数")
+    parser.add_argument("--zips", type=int, default=5000, help="GOFO 邮编库行数")
+    parser.add_argument("--zip-left", action="store_true", help="GOFO 邮编库放在价格表左侧")
+    parser.add_argument("--tiers", type=int, default=len(gen.TIER_FILES), help="工作簿数量 (T0 起)")
+    parser.add_argument("--repeat", type=int, default=3, help="每阶段重复次数, 取最短/中位数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_results.json", help="结果 JSON 路径")
+    parser.add_argument("--compare", default=None, help="与之前的结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=1.25, help="判定回归的耗时倍数")
+    parser.add_argument("--keep", action="store_true", help="保留合成数据的临时目录")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    tiers = list(gen.TIER_FILES)[:args.tiers]
+    out_path = os.path.abspath(args.out)
+    workdir = tempfile.mkdtemp(prefix="sugou-bench-")
+    cwd = os.getcwd()
+    try:
+        os.makedirs(os.path.join(workdir, gen.DATA_DIR))
+        t0 = time.perf_counter()
+        for i, tier in enumerate(tiers):
+            make_tier_workbook(os.path.join(workdir, gen.DATA_DIR, gen.TIER_FILES[tier]),
+                               breaks=args.breaks, zips=args.zips, seed=args.seed + i, zip_left=args.zip_left)
+        print(f"--- Synthetic workbooks: {len(tiers)} x {args.breaks} breaks, {args.zips} zips "
+              f"({time.perf_counter() - t0:.1f}s) ---")
+        os.chdir(workdir)
+        stages = run_benchmark(tiers, repeat=args.repeat)
+    finally:
+        os.chdir(cwd)
+        if args.keep: print(f"  [Info] Synthetic data kept in {workdir}")
+        else: shutil.rmtree(workdir, ignore_errors=True)
+
+    import numpy as np
+    import pandas as pd
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(), "parser_version": gen.PARSER_VERSION,
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "platform": platform.platform(),
+            "config": {"breaks": args.breaks, "zips": args.zips, "tiers": len(tiers), "repeat": args.repeat, "seed": args.seed,
+                       "zip_left": args.zip_left},
+        },
+        "stages": stages,
+    }
+    for name in STAGES:
+        st = stages[name]
+        extra = ", ".join(f"{k}={v}" for k, v in st.items() if k not in ("min", "median", "runs"))
+        print(f"  {name:<20} min {st['min'] * 1000:9.1f}ms  median {st['median'] * 1000:9.1f}ms  {extra}")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"✅ Results written to {out_path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("config") != result["meta"]["config"]:
+            print("  [Warn] Baseline was recorded with a different config")
+        if compare(result, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,28 @@
-import pandas as pd
+import csv
 import json
 import re
+import math
+import base64
+import numpy as np
 import os
 import warnings
 import subprocess
-from datetime import datetime
+import sys
+import hashlib
+import io
+import gzip
+import pickle
+import argparse
+import time
+import itertools
+import threading
+import marshal
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # 忽略 Excel 样式警告
 warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
@@ -14,10 +32,39 @@ warnings.filterwarnings('ignore', category=UserWarning, module='openpyxl')
 # ==========================================
 DATA_DIR = "data"
 OUTPUT_DIR = "public"
+SHARD_DIR = "shards"  # OUTPUT_DIR 下的数据分片目录
+ASSET_DIR = "assets"  # OUTPUT_DIR 下的静态资源 (内容哈希命名)
+SW_FILE = "sw.js"  # OUTPUT_DIR 下的 Service Worker, 预缓存页面/资源/分片供离线与秒开
+VENDOR_DIR = "vendor"  # 第三方资源的本地副本; 首次构建从 CDN 下载, 无网络时可手工放入同名文件
+VENDOR_TIMEOUT = 10  # 下载第三方资源的超时 (秒)
+# 页面用到的第三方资源: 文件名 -> CDN 地址 + 固定的 SRI 摘要 (本地副本不可用时页面直接引用 CDN).
+# 下载内容或 vendor/ 下的副本与摘要不符时一律不用, 以免把被篡改的文件打进页面.
+# 页面只用 Bootstrap 的样式, 没有用到其 JS 组件, 故不再引入 bootstrap.bundle.js
+VENDOR_ASSETS = {
+    "bootstrap.min.css": {
+        "url": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+        "integrity": "sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM",
+    },
+}
+CACHE_DIR = ".build_cache"
+WATCH_POLL = 0.5  # --watch 轮询间隔 (秒)
+WATCH_DEBOUNCE = 1.0  # 输入文件静止多久才视为写完 (秒)
+RATE_STORE_DIR = "rate_store"  # 二进制价格库 (.npy + index.json), 不随页面发布
+REPORT_FILE = "build_report.json"  # OUTPUT_DIR 下的构建报告
+PROFILE_FILE = "build_profile.prof"  # --profile 时最慢阶段的 cProfile 数据
+PARSER_VERSION = 7  # 解析逻辑变更时递增, 使旧缓存全部失效
 
 TIER_FILES = {
     "T0": "T0.xlsx", "T1": "T1.xlsx", "T2": "T2.xlsx", "T3": "T3.xlsx"
 }
+GOFO_ZIP_TIER = "T0"  # GOFO 邮编库来源工作簿
+# 带日期的价格发布: data/<起始日>/ 或 data/<起始日>_<截止日>/ (如旺季价, 截止日含当天), 目录内放任意几个等级的工作簿.
+# 某日某等级某渠道取 "覆盖该日且含该表的发布中起始日最晚的一个", 旺季结束后自动回落到之前的发布.
+# 页面仍由 data/ 下的 TIER_FILES 生成; 发布进入 rate_versions (QuoteEngine.as_of / 审计 ship_date) 与二进制价格库
+_RELEASE_DIR_RE = re.compile(r'^(\d{4}-\d{2}-\d{2})(?:_(\d{4}-\d{2}-\d{2}))?$')
+DAS_PDF_FILES = ("FGE_DAS_Contiguous_Extended_Alaska_Hawaii_2025.pdf", "FGE_DAS_Zip_Code_Changes_2025.pdf")
+# DAS 类别, 按优先级排列: 一个邮编同时在多个类别时只报第一个
+DAS_CATEGORIES = ("remote", "extended", "alaska", "hawaii")
 
 # 州名映射
 US_STATES_CN = {
@@ -92,6 +139,21 @@ CHANNEL_CONFIG = {
     }
 }
 
+# 分区规则 (按 zone_source): 发货仓区域 -> ([(3位前缀起, 止, Zone)], 未命中时的 Zone), 首条命中生效
+# "*" 表示与发货仓区域无关; 未列出的区域一律 Zone 8. 构建时编译成查找表, 页面与 Python 直接按下标取
+ZONE_RULES = {
+    "gofo": {"*": ([], 8)},
+    "xlmiles": {"*": ([(900, 935, 2), (936, 994, 3)], 6)},
+    "general": {
+        "WEST": ([(900, 935, 2), (936, 994, 4), (800, 899, 5), (0, 200, 8)], 7),
+        "EAST": ([(0, 199, 2), (200, 299, 4), (900, 999, 8)], 6),
+        "CENTRAL": ([(600, 629, 2), (400, 599, 4), (900, 999, 7), (0, 200, 6)], 5),
+    },
+}
+# GOFO 按 5 位邮编所属大区判断: 与发货仓同区为 Zone 2, 其余 Zone 8
+GOFO_LOCAL_REGION = {"WEST": "WE", "CENTRAL": "CE", "EAST": "EA"}
+GOFO_LOCAL_ZONE = 2
+
 # ==========================================
 # 2. HTML/JS
 # ==========================================
@@ -102,7 +164,7 @@ HTML_TEMPLATE = r"""
   <meta charset="UTF-8">
   <meta name="viewport" content="width=device-width, initial-scale=1.0">
   <title>业务员报价助手 (V2026.10 终极修复版)</title>
-  <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
+  <link href="__ASSET:bootstrap.min.css__" rel="stylesheet">
   <style>
     body { background-color: #f4f7f6; font-family: 'Segoe UI', sans-serif; }
     .header-bar { background: #222; color: #fff; padding: 15px 0; border-bottom: 4px solid #fd7e14; margin-bottom: 20px; }
@@ -195,6 +257,9 @@ HTML_TEMPLATE = r"""
                 <span class="input-group-text">实重</span>
                 <input type="number" class="form-control" id="weight" placeholder="LBS">
               </div>
+              <label class="form-label small fw-bold text-muted mt-3 mb-1" for="piecesInput">多件货 (每行一种箱规: 长 宽 高 实重 [箱数])</label>
+              <textarea class="form-control form-control-sm font-monospace" id="piecesInput" rows="3" placeholder="24 16 12 35 2&#10;10 8 6 3"></textarea>
+              <div class="form-text">填写后按整票报价, 忽略上方单件规格</div>
             </div>
 
             <div class="compliance-box" id="complianceBox" style="display:none;">
@@ -203,6 +268,7 @@ HTML_TEMPLATE = r"""
             </div>
 
             <button type="button" class="btn btn-primary w-100 mt-4 fw-bold py-2" id="btnCalc">计算报价 (Calculate)</button>
+            <button type="button" class="btn btn-outline-primary w-100 mt-2 fw-bold" id="btnShop">多仓比价 (全部仓库)</button>
           </form>
         </div>
       </div>
@@ -255,45 +321,177 @@ HTML_TEMPLATE = r"""
   &copy; 2026 SureGo Logistics | Data Generated: <span id="updateTime"></span>
 </footer>
 
-<script>
-  const DATA = __JSON_DATA__;
-  document.getElementById('updateTime').innerText = new Date().toLocaleDateString();
+<script type="application/json" id="rate-data">__JSON_DATA__</script>
+<script id="calc-engine">
+  // 报价引擎 (解码/查价/分区/规格校验): 主线程直接执行, 同一段源码另起 Web Worker, 报价在后台线程计算
+  // DATA 由 initEngine 注入: 主线程为页面外壳, Worker 为主线程发来的副本 (分片 URL 已转为绝对地址)
+  let DATA = null;
+  function initEngine(data) { DATA = data; }
 
-  // 1. 邮编双显
-  document.getElementById('zipCode').addEventListener('input', function() {
-    let zip = this.value.trim();
-    let display = document.getElementById('locDisplay');
-    if(zip.length === 5) {
-        let html = '';
-        // GOFO
-        if(DATA.gofo_zips && DATA.gofo_zips[zip]) {
-            let g = DATA.gofo_zips[zip];
-            html += `<div class="tag-gofo">🟢 [GOFO表] ${g.city}, ${g.state} (${g.cn_state}) - 区:${g.region}</div>`;
+  // 分片: DATA.shards 为 名称 -> 带内容哈希的 URL (--inline 构建时数据在 DATA.inline 中), 每片只请求一次
+  const SHARDS = {};
+  function loadShard(name) {
+    if (!SHARDS[name]) {
+      if (DATA.inline) SHARDS[name] = Promise.resolve(DATA.inline[name] || null);
+      else if (!DATA.shards[name]) SHARDS[name] = Promise.resolve(null);
+      else SHARDS[name] = fetch(DATA.shards[name]).then(r => {
+        if (!r.ok) throw new Error(`${name}: HTTP ${r.status}`);
+        return r.json();
+      }, err => {
+        // 双击打开 (file://) 时浏览器不允许 fetch 本地文件, 分片构建的页面只能经 http 访问
+        if (new URL(DATA.shards[name], location.href).protocol !== 'file:') throw err;
+        throw new Error('直接打开的本地页面 (file://) 无法读取数据分片, 请用 python generate.py build --inline 生成可双击打开的单文件页面, ' +
+                        '或经 http 访问 public/ (如 python -m http.server -d public)');
+      });
+    }
+    return SHARDS[name];
+  }
+
+  // 0. 列式价格表: 加载时一次性解码为 TypedArray, 查价用二分
+  function b64Array(a) {
+    const bin = atob(a.b), bytes = new Uint8Array(bin.length);
+    for (let i = 0; i < bin.length; i++) bytes[i] = bin.charCodeAt(i);
+    if (a.t === 'u1') return bytes;
+    if (a.t === 'u2') return new Uint16Array(bytes.buffer);
+    if (a.t === 'i4') return new Int32Array(bytes.buffer);
+    if (a.t === 'f4') return Float64Array.from(new Float32Array(bytes.buffer));
+    if (a.t === 'c4') return Float64Array.from(new Int32Array(bytes.buffer), c => c / 100);
+    return new Float64Array(bytes.buffer);
+  }
+
+  function decodeTable(t) {
+    const tbl = { n: t.n, w: b64Array(t.w), zones: {}, ranges: null };
+    Object.keys(t.zones).forEach(z => { tbl.zones[z] = b64Array(t.zones[z]); });
+    if (t.svc) {
+      // 行已按 (服务, 重量) 排序, 记录每种服务的 [起, 止)
+      const svc = b64Array(t.svc);
+      tbl.ranges = {};
+      for (let i = 0; i < svc.length; i++) {
+        const code = t.services[svc[i]];
+        if (!tbl.ranges[code]) tbl.ranges[code] = [i, i];
+        tbl.ranges[code][1] = i + 1;
+      }
+    }
+    return tbl;
+  }
+
+  const TABLES = {};
+  function ensureTier(tier) {
+    return loadShard('tier:' + tier).then(d => {
+      if (TABLES[tier]) return;
+      TABLES[tier] = {};
+      Object.keys(d || {}).forEach(ch => { TABLES[tier][ch] = decodeTable(d[ch].table); });
+    });
+  }
+
+  // 分区查找表 (每个仓库一片): ZONES[仓库][zone_source] = { prefix: 3 位前缀表, zip5: 5 位邮编整表 (仅有覆盖时) }
+  const ZONES = {};
+  function ensureZones(wh) {
+    return loadShard('zones:' + wh).then(zt => { if (zt && !ZONES[wh]) decodeZoneTables(zt); });
+  }
+
+  function decodeZoneTables(zt) {
+    const keys = zt.zip5_keys ? b64Array(zt.zip5_keys) : null;
+    const tables = zt.tables.map(b64Array), dense = {};
+    Object.keys(zt.warehouses).forEach(wh => {
+      ZONES[wh] = {};
+      Object.keys(zt.warehouses[wh]).forEach(src => {
+        const t = zt.warehouses[wh][src], prefix = tables[t.prefix];
+        let zip5 = null;
+        if (t.zip5 !== undefined && keys) {
+          const k = t.prefix + ':' + t.zip5;
+          if (!dense[k]) {
+            // 先按前缀铺满, 再写入逐邮编覆盖
+            const full = new Uint8Array(100000), v = tables[t.zip5];
+            for (let p = 0; p < 1000; p++) full.fill(prefix[p], p * 100, p * 100 + 100);
+            for (let i = 0; i < keys.length; i++) full[keys[i]] = v[i];
+            dense[k] = full;
+          }
+          zip5 = dense[k];
         }
-        // FedEx
-        let fedexInfo = "通用地区";
-        if(DATA.fedex_das_remote && DATA.fedex_das_remote.includes(zip)) fedexInfo = "⚠️ FedEx 偏远 (Remote)";
-        else if(DATA.fedex_das_extended && DATA.fedex_das_extended.includes(zip)) fedexInfo = "⚠️ FedEx 扩展 (Extended)";
-        
-        html += `<div class="tag-fedex">🔵 [FedEx/通用] ${fedexInfo}</div>`;
-        display.innerHTML = `<div class="loc-box">${html}</div>`;
-    } else {
-        display.innerHTML = '';
+        ZONES[wh][src] = { prefix, zip5 };
+      });
+    });
+  }
+
+  // FedEx DAS: 每个类别一张 100000 位位图 (区间编码的在加载时展开), 查询为一次位运算
+  const DAS_LABELS = {
+    remote: "⚠️ FedEx 偏远 (Remote)", extended: "⚠️ FedEx 扩展 (Extended)",
+    alaska: "⚠️ FedEx 阿拉斯加 (Alaska)", hawaii: "⚠️ FedEx 夏威夷 (Hawaii)"
+  };
+  let DAS = [], GOFO = null;
+  function decodeDas(das) {
+    return das.order.map(cat => {
+      const s = das.sets[cat];
+      let bits;
+      if (s.bitmap) bits = b64Array(s.bitmap);
+      else {
+        bits = new Uint8Array(12500);
+        const r = b64Array(s.ranges);
+        for (let i = 0; i < r.length; i += 2)
+          for (let z = r[i]; z < r[i + 1]; z++) bits[z >> 3] |= 1 << (z & 7);
+      }
+      return { cat, bits };
+    });
+  }
+
+  // 邮编库与 DAS 只在第一次输入邮编时加载
+  let locationReady = null;
+  function ensureLocation() {
+    if (!locationReady) locationReady = Promise.all([loadShard('gofo_zips'), loadShard('fedex_das')]).then(([g, das]) => {
+      if (g) GOFO = decodeZipDb(g);
+      if (das) DAS = decodeDas(das);
+    });
+    return locationReady;
+  }
+
+  // GOFO 邮编库: 有序邮编二分查找, 城市/州/大区为字典编码
+  function decodeZipDb(db) {
+    return {
+      zip: b64Array(db.zip), city: b64Array(db.city), state: b64Array(db.state), region: b64Array(db.region),
+      cities: db.cities, states: db.states, states_cn: db.states_cn, regions: db.regions
+    };
+  }
+
+  function gofoInfo(zip) {
+    if (!GOFO || !/^\d{5}$/.test(zip)) return null;
+    const z = +zip, i = lowerBound(GOFO.zip, z, 0, GOFO.zip.length);
+    if (i >= GOFO.zip.length || GOFO.zip[i] !== z) return null;
+    const s = GOFO.state[i];
+    return { city: GOFO.cities[GOFO.city[i]], state: GOFO.states[s], cn_state: GOFO.states_cn[s], region: GOFO.regions[GOFO.region[i]] };
+  }
+
+  function dasCategory(zip) {
+    if (!/^\d{5}$/.test(zip)) return null;
+    const z = +zip;
+    for (const d of DAS) if ((d.bits[z >> 3] >> (z & 7)) & 1) return d.cat;
+    return null;
+  }
+
+  function lowerBound(arr, x, lo, hi) {
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (arr[mid] < x) lo = mid + 1; else hi = mid;
     }
-  });
+    return lo;
+  }
 
-  // 2. 燃油
-  (function initFuel() {
-    let maxFuel = 0;
-    if(DATA.tiers && DATA.tiers.T3) {
-        Object.values(DATA.tiers.T3).forEach(ch => {
-            if(ch.fuel_rate && ch.fuel_rate > maxFuel) maxFuel = ch.fuel_rate;
-        });
+  // 取第一个 w >= 计费重 的档位; 分区无价时回退到 fallbackZone
+  function lookupPrice(tbl, zone, wt, fallbackZone, svcCode) {
+    if (!tbl) return 0;
+    let lo = 0, hi = tbl.n;
+    if (tbl.ranges) {
+      const r = tbl.ranges[svcCode];
+      if (!r) return 0;
+      lo = r[0]; hi = r[1];
     }
-    if(maxFuel > 0) document.getElementById('fuelInput').value = (maxFuel * 100).toFixed(2);
-  })();
+    const i = lowerBound(tbl.w, wt - 0.001, lo, hi);
+    if (i >= hi) return 0;
+    const col = tbl.zones[zone], fb = tbl.zones[fallbackZone];
+    return (col && col[i]) || (fb && fb[i]) || 0;
+  }
 
-  // 3. 规格校验
+  // 规格校验
   function getXLService(L, W, H, Wt) {
     let dims = [L, W, H].sort((a,b)=>b-a);
     let maxL = dims[0];
@@ -319,23 +517,268 @@ HTML_TEMPLATE = r"""
     return { msgs, status };
   }
 
+  // Zone 计算
+  function calcZone(destZip, originZip, conf) {
+    if(!destZip || destZip.length < 3) return 8;
+    const t = (ZONES[originZip] || {})[conf.zone_source];
+    if(!t) return 8;
+    if(t.zip5 && /^\d{5}$/.test(destZip)) return t.zip5[+destZip];
+    let d = parseInt(destZip.substring(0,3));
+    return t.prefix[d >= 0 && d <= 999 ? d : 1000];
+  }
+
+  // 渠道索引: 每个仓库可用的渠道及渠道类型只判断一次
+  const CHANNEL_INDEX = {};
+  function channelsFor(whCode) {
+    if (!CHANNEL_INDEX[whCode]) CHANNEL_INDEX[whCode] = Object.keys(DATA.channels)
+      .filter(chName => DATA.channels[chName].allow_wh.includes(whCode))
+      .map(chName => ({
+        chName, conf: DATA.channels[chName], isXL: chName.includes("XLmiles"),
+        isUniuni: chName.includes("UNIUNI"), isUsps: chName.includes("USPS"),
+        isFedexStd: chName.includes("FedEx") && !chName.includes("超大")
+      }));
+    return CHANNEL_INDEX[whCode];
+  }
+
+  // 某仓库各可用渠道的报价, 顺序同 DATA.channels
+  // pieces: [{L, W, H, Wt, qty}], 一票多件整票走同一渠道, 任一件超规或无价则该渠道不可用;
+  // 各件的计费重/规格/XL 服务先算好供各渠道共用, 分区按票只算一次, 住宅/签名费按箱计
+  function quoteWarehouse(whCode, tier, fuelRateInput, zip, isRes, sigOn, pieces) {
+    const items = pieces.map(pkg => ({
+      pkg, qty: pkg.qty || 1, comp: checkCompliance(pkg),
+      xl: getXLService(pkg.L, pkg.W, pkg.H, pkg.Wt),
+      rawWt: Math.max(pkg.Wt, (pkg.L * pkg.W * pkg.H) / 222)
+    }));
+    const count = items.reduce((n, x) => n + x.qty, 0);
+    let zones = {};  // 同一 zone_source 的渠道共用一次分区计算
+    let quotes = [];
+
+    channelsFor(whCode).forEach(c => {
+      const chName = c.chName, conf = c.conf;
+      if(items.some(x =>
+        (c.isUniuni && x.comp.status.uniuni.startsWith("NO")) ||
+        (c.isUsps && x.comp.status.usps.startsWith("NO")) ||
+        (c.isXL && x.comp.status.xl.startsWith("NO")) ||
+        (c.isFedexStd && (x.pkg.Wt > 150 || x.pkg.L > 108)))) return;
+
+      let zone = zones[conf.zone_source];
+      if(zone === undefined) zone = zones[conf.zone_source] = calcZone(zip, whCode, conf);
+      let tbl = (TABLES[tier] || {})[chName];
+
+      const fuelOn = conf.fuel_mode !== 'none' && conf.fuel_mode !== 'included';
+      let rate = fuelRateInput / 100;
+      let tag = "";
+      if (conf.fuel_mode === 'discount_85') {
+          rate = rate * 0.85; 
+          tag = " (85折)";
+      }
+
+      // 逐件计价, 整票按箱数累加
+      let finalWt = 0, basePrice = 0, fuelAmt = 0, total = 0;
+      let lines = [], services = [];
+      for (const x of items) {
+        let wt = c.isXL ? x.rawWt : Math.ceil(x.rawWt);
+        // XLmiles 只在该服务类型 (AH/OS/OM) 的档位内查找, Fallback Zone 6; 其余 Fallback Zone 8
+        let base = c.isXL ? lookupPrice(tbl, zone, wt, 6, x.xl.code) : lookupPrice(tbl, zone, wt, 8);
+        if(base <= 0) return;
+
+        let surcharges = 0;
+        if(isRes && conf.fees.res > 0) surcharges += conf.fees.res;
+        if(sigOn && conf.fees.sig > 0) surcharges += conf.fees.sig;
+        let fuel = fuelOn ? (base + surcharges) * rate : 0;
+        surcharges += fuel;
+
+        finalWt += x.qty * wt;
+        basePrice += x.qty * base;
+        fuelAmt += x.qty * fuel;
+        total += x.qty * (base + surcharges);
+        lines.push({ qty: x.qty, finalWt: wt, total: base + surcharges });
+        if (c.isXL && !services.includes(x.xl.name)) services.push(x.xl.name);
+      }
+
+      let svcTag = services.length ? `<br><small class="text-primary">${services.join(' / ')}</small>` : "";
+      let details = [];
+      const perBox = count > 1 ? ` × ${count}` : "";
+      if(isRes && conf.fees.res > 0) details.push(`住宅 $${conf.fees.res}${perBox}`);
+      if(sigOn && conf.fees.sig > 0) details.push(`签名 $${conf.fees.sig}${perBox}`);
+      if (fuelOn) details.push(`燃油${tag} ${(rate*100).toFixed(2)}%: $${fuelAmt.toFixed(2)}`);
+      else if (conf.fuel_mode === 'included') details.push(`燃油: 已含`);
+
+      const q = { chName, svcTag, zone, finalWt, basePrice, details, total };
+      if (count > 1) {
+        q.finalWt = Math.round(finalWt * 100) / 100;
+        q.lines = lines;
+      }
+      quotes.push(q);
+    });
+    return quotes;
+  }
+
+  // 多仓比价: 所有仓库 × 渠道一起算, 按总费用从低到高排列 (同价按仓库代码、渠道顺序, 与 quote_engine.rate_shop 一致)
+  function shopQuotes(whs, tier, fuelRateInput, zip, isRes, sigOn, pieces) {
+    let quotes = [];
+    whs.forEach(wh => quoteWarehouse(wh, tier, fuelRateInput, zip, isRes, sigOn, pieces).forEach(q => { q.wh = wh; quotes.push(q); }));
+    return quotes.sort((a, b) => a.total - b.total);
+  }
+
+  // 一次计算请求: 先等所需分片就位. op = quote (单仓) / shop (多仓比价) / prefetch (只预取)
+  function runRequest(op, a) {
+    const whs = op === 'quote' ? [a.whCode] : a.whs;
+    return Promise.all([ensureTier(a.tier)].concat(whs.map(ensureZones))).then(() => {
+      if (op === 'quote') return quoteWarehouse(a.whCode, a.tier, a.fuelRateInput, a.zip, a.isRes, a.sigOn, a.pieces);
+      if (op === 'shop') return shopQuotes(a.whs, a.tier, a.fuelRateInput, a.zip, a.isRes, a.sigOn, a.pieces);
+      return null;
+    });
+  }
+
+  // Worker 入口 (主线程有 document, 不会执行)
+  if (typeof document === 'undefined') {
+    self.onmessage = e => {
+      const m = e.data;
+      if (m.op === 'init') { initEngine(m.data); return; }
+      runRequest(m.op, m.args).then(
+        result => self.postMessage({ id: m.id, result }),
+        err => self.postMessage({ id: m.id, error: err.message }));
+    };
+  }
+</script>
+<script>
+  // JSON.parse 比同等大小的 JS 字面量解析更快; 外壳只含仓库/渠道/燃油费率, 其余数据分片按需加载
+  initEngine(JSON.parse(document.getElementById('rate-data').textContent));
+  document.getElementById('updateTime').innerText = new Date().toLocaleDateString();
+
+  // 报价在 Web Worker 中计算 (源码即 calc-engine 脚本), 输入时界面不卡顿; 不支持或启动失败时退回主线程
+  const CALC = { worker: null, seq: 0, pending: {} };
+  (function startWorker() {
+    if (typeof Worker === 'undefined' || typeof Blob === 'undefined' || typeof URL === 'undefined') return;
+    try {
+      const src = document.getElementById('calc-engine').textContent;
+      const w = new Worker(URL.createObjectURL(new Blob([src], { type: 'text/javascript' })));
+      // Worker 的基址是 blob: URL, 分片地址先转为绝对地址
+      const data = Object.assign({}, DATA, { shards: {} });
+      Object.keys(DATA.shards || {}).forEach(k => { data.shards[k] = new URL(DATA.shards[k], location.href).href; });
+      w.onmessage = e => {
+        const p = CALC.pending[e.data.id];
+        if (!p) return;
+        delete CALC.pending[e.data.id];
+        if (e.data.error) p.reject(new Error(e.data.error)); else p.resolve(e.data.result);
+      };
+      w.onerror = e => {
+        // 如 CSP 禁止 blob: Worker; 之后全部在主线程算, 未完成的请求也改在主线程重算
+        if (e.preventDefault) e.preventDefault();
+        w.terminate();
+        CALC.worker = null;
+        Object.keys(CALC.pending).forEach(id => {
+          const p = CALC.pending[id];
+          delete CALC.pending[id];
+          runRequest(p.op, p.args).then(p.resolve, p.reject);
+        });
+      };
+      w.postMessage({ op: 'init', data });
+      CALC.worker = w;
+    } catch (e) {
+      CALC.worker = null;
+    }
+  })();
+
+  function calc(op, args) {
+    if (!CALC.worker) return runRequest(op, args);
+    return new Promise((resolve, reject) => {
+      const id = ++CALC.seq;
+      CALC.pending[id] = { op, args, resolve, reject };
+      CALC.worker.postMessage({ id, op, args });
+    });
+  }
+
+  // 1. 邮编双显
+  document.getElementById('zipCode').addEventListener('input', function() {
+    const input = this;
+    let zip = input.value.trim();
+    let display = document.getElementById('locDisplay');
+    if(zip.length !== 5) {
+        display.innerHTML = '';
+        return;
+    }
+    return ensureLocation().then(() => {
+        // 加载期间邮编已改动则丢弃本次结果
+        if(input.value.trim() !== zip) return;
+        let html = '';
+        // GOFO
+        let g = gofoInfo(zip);
+        if(g) {
+            html += `<div class="tag-gofo">🟢 [GOFO表] ${g.city}, ${g.state} (${g.cn_state}) - 区:${g.region}</div>`;
+        }
+        // FedEx
+        let fedexInfo = DAS_LABELS[dasCategory(zip)] || "通用地区";
+        
+        html += `<div class="tag-fedex">🔵 [FedEx/通用] ${fedexInfo}</div>`;
+        display.innerHTML = `<div class="loc-box">${html}</div>`;
+    });
+  });
+
+  // 2. 燃油
+  (function initFuel() {
+    let maxFuel = 0;
+    if(DATA.fuel_rates && DATA.fuel_rates.T3) {
+        Object.values(DATA.fuel_rates.T3).forEach(rate => {
+            if(rate && rate > maxFuel) maxFuel = rate;
+        });
+    }
+    if(maxFuel > 0) document.getElementById('fuelInput').value = (maxFuel * 100).toFixed(2);
+  })();
+
+  // 3. 规格校验
+  // 多件货: 每行 "长 宽 高 实重 [箱数]" (空格/逗号/x 分隔), 不足 4 个数的行忽略
+  function parsePieces(text) {
+    const pieces = [];
+    text.split('\n').forEach(line => {
+      const v = line.trim().split(/[\s,xX×*]+/).filter(Boolean).map(Number);
+      if (v.length < 4 || v.slice(0, 4).some(x => !(x >= 0))) return;
+      pieces.push({ L: v[0], W: v[1], H: v[2], Wt: v[3], qty: v[4] >= 1 ? Math.floor(v[4]) : 1 });
+    });
+    return pieces;
+  }
+
   function updateComplianceUI() {
-    let L = parseFloat(document.getElementById('dimL').value)||0;
-    let W = parseFloat(document.getElementById('dimW').value)||0;
-    let H = parseFloat(document.getElementById('dimH').value)||0;
-    let Wt = parseFloat(document.getElementById('weight').value)||0;
-    if(L>0 && Wt>0) {
-      let res = checkCompliance({L,W,H,Wt});
+    let pieces = parsePieces(document.getElementById('piecesInput').value);
+    if (pieces.length === 0) {
+      let L = parseFloat(document.getElementById('dimL').value)||0;
+      let W = parseFloat(document.getElementById('dimW').value)||0;
+      let H = parseFloat(document.getElementById('dimH').value)||0;
+      let Wt = parseFloat(document.getElementById('weight').value)||0;
+      if(L>0 && Wt>0) pieces = [{L,W,H,Wt}];
+    }
+    if(pieces.length > 0) {
+      // 多行时标出是第几行不合规
+      const multi = pieces.length > 1, bad = { uniuni: [], usps: [], xl: [] };
       let html = "";
-      if(res.msgs.length > 0) html += `<li class="fw-bold">${res.msgs.join(', ')}</li>`;
-      html += `<li>UniUni: ${res.status.uniuni}</li><li>USPS: ${res.status.usps}</li><li>XLmiles: ${res.status.xl}</li>`;
+      pieces.forEach((pkg, i) => {
+        let res = checkCompliance(pkg);
+        if(res.msgs.length > 0) html += `<li class="fw-bold">${multi ? `第${i + 1}行: ` : ''}${res.msgs.join(', ')}</li>`;
+        Object.keys(bad).forEach(k => { if (res.status[k] !== 'OK') bad[k].push(i + 1); });
+      });
+      const st = k => bad[k].length === 0 ? 'OK' : multi ? `NO (第${bad[k].join(',')}行)` : 'NO';
+      html += `<li>UniUni: ${st('uniuni')}</li><li>USPS: ${st('usps')}</li><li>XLmiles: ${st('xl')}</li>`;
       document.getElementById('complianceList').innerHTML = html;
       document.getElementById('complianceBox').style.display = 'block';
     } else {
       document.getElementById('complianceBox').style.display = 'none';
     }
   }
-  ['dimL','dimW','dimH','weight'].forEach(id => document.getElementById(id).addEventListener('input', updateComplianceUI));
+  ['dimL','dimW','dimH','weight','piecesInput'].forEach(id => document.getElementById(id).addEventListener('input', updateComplianceUI));
+
+  // 实时报价: 邮编满 5 位且填了重量后, 输入停顿 LIVE_DELAY 毫秒即按上次的模式 (单仓/比价) 重算
+  const LIVE_DELAY = 150;
+  let liveTimer = null;
+  function liveQuote() {
+    clearTimeout(liveTimer);
+    liveTimer = setTimeout(() => {
+      const f = readForm();
+      if (f.zip.length === 5 && f.pieces.some(p => p.Wt > 0)) requestQuote(lastMode);
+    }, LIVE_DELAY);
+  }
+  ['zipCode','dimL','dimW','dimH','weight','piecesInput','fuelInput'].forEach(id => document.getElementById(id).addEventListener('input', liveQuote));
+  ['addrType','sigToggle'].forEach(id => document.getElementById(id).addEventListener('change', liveQuote));
 
   // 4. 初始化
   const whSelect = document.getElementById('whSelect');
@@ -345,180 +788,180 @@ HTML_TEMPLATE = r"""
     opt.text = DATA.warehouses[code].name;
     whSelect.appendChild(opt);
   });
+  function prefetch(tier, whs) {
+    calc('prefetch', { tier, whs }).catch(() => {});
+  }
   whSelect.addEventListener('change', () => {
     document.getElementById('whRegion').innerText = `区域: ${DATA.warehouses[whSelect.value].region}`;
     document.getElementById('resBody').innerHTML = '<tr><td colspan="7" class="text-center py-4 text-muted">仓库已切换，请点击计算</td></tr>';
+    prefetch(document.querySelector('input[name="tier"]:checked').value, [whSelect.value]);
+    liveQuote();
   });
   if(whSelect.options.length > 0) whSelect.dispatchEvent(new Event('change'));
+  // 切换等级时预取对应价格表分片
+  document.querySelectorAll('input[name="tier"]').forEach(r => r.addEventListener('change', () => {
+    prefetch(r.value, [whSelect.value]);
+    liveQuote();
+  }));
 
-  // 5. Zone 计算
-  function calcZone(destZip, originZip, conf) {
-    if(!destZip || destZip.length < 3) return 8;
-    let d = parseInt(destZip.substring(0,3));
-    let whRegion = DATA.warehouses[originZip].region;
-
-    if(conf.zone_source === 'gofo') {
-        if(DATA.gofo_zips && DATA.gofo_zips[destZip]) {
-            let zReg = DATA.gofo_zips[destZip].region; 
-            if(whRegion=='WEST' && zReg=='WE') return 2;
-            if(whRegion=='CENTRAL' && zReg=='CE') return 2;
-            if(whRegion=='EAST' && zReg=='EA') return 2;
-            return 8; 
-        }
-        return 8;
-    }
-    
-    // XLmiles (Special Zone 1,2,3,6 logic or simple mapping)
-    if(conf.zone_source === 'xlmiles') {
-        // XLmiles usually only from WEST (91730)
-        // Simply map standard zones to XL zones: 
-        // 2->2, 3->3, 4->3, 5->6, 6->6, 7->6, 8->6 
-        // Logic simplified for demo, you might need exact table
-        if(d >= 900 && d <= 935) return 2;
-        if(d >= 936 && d <= 994) return 3;
-        return 6; 
-    }
-
-    // Standard FedEx/USPS
-    if(whRegion === 'WEST') {
-      if(d >= 900 && d <= 935) return 2; 
-      if(d >= 936 && d <= 994) return 4;
-      if(d >= 800 && d <= 899) return 5;
-      if(d >= 0 && d <= 200) return 8;
-      return 7;
-    }
-    if(whRegion === 'EAST') {
-      if(d >= 0 && d <= 199) return 2;
-      if(d >= 200 && d <= 299) return 4; 
-      if(d >= 900 && d <= 999) return 8;
-      return 6;
-    }
-    if(whRegion === 'CENTRAL') {
-       if(d >= 600 && d <= 629) return 2;
-       if(d >= 400 && d <= 599) return 4;
-       if(d >= 900 && d <= 999) return 7;
-       if(d >= 0 && d <= 200) return 6;
-       return 5;
-    }
-    return 8;
-  }
-
-  // 6. 计算
-  document.getElementById('btnCalc').onclick = () => {
-    const whCode = whSelect.value;
-    const tier = document.querySelector('input[name="tier"]:checked').value;
-    const fuelRateInput = parseFloat(document.getElementById('fuelInput').value) || 0;
-    const zip = document.getElementById('zipCode').value.trim();
-    const isRes = document.getElementById('addrType').value === 'res';
-    const sigOn = document.getElementById('sigToggle').checked;
-    
-    const pkg = {
-      L: parseFloat(document.getElementById('dimL').value)||0,
-      W: parseFloat(document.getElementById('dimW').value)||0,
-      H: parseFloat(document.getElementById('dimH').value)||0,
-      Wt: parseFloat(document.getElementById('weight').value)||0
+  // 5. 计算
+  // 填了多件货则按整票报价, 否则为上方单件 (箱数 1)
+  function readForm() {
+    const pieces = parsePieces(document.getElementById('piecesInput').value);
+    return {
+      whCode: whSelect.value,
+      tier: document.querySelector('input[name="tier"]:checked').value,
+      fuelRateInput: parseFloat(document.getElementById('fuelInput').value) || 0,
+      zip: document.getElementById('zipCode').value.trim(),
+      isRes: document.getElementById('addrType').value === 'res',
+      sigOn: document.getElementById('sigToggle').checked,
+      pieces: pieces.length > 0 ? pieces : [{
+        L: parseFloat(document.getElementById('dimL').value)||0,
+        W: parseFloat(document.getElementById('dimW').value)||0,
+        H: parseFloat(document.getElementById('dimH').value)||0,
+        Wt: parseFloat(document.getElementById('weight').value)||0,
+        qty: 1
+      }]
     };
+  }
 
-    document.getElementById('resTierBadge').innerText = tier;
-    let dimWt = (pkg.L * pkg.W * pkg.H) / 222;
-    document.getElementById('pkgInfo').innerHTML = 
-      `<b>Pkg:</b> ${pkg.L}x${pkg.W}x${pkg.H}" | 实重:${pkg.Wt} | 体积重:${dimWt.toFixed(2)}`;
-
+  // 只渲染最后一次请求的结果: 连续输入时, 晚于新请求返回的旧结果直接丢弃
+  let renderSeq = 0, lastMode = 'quote';
+  function requestQuote(mode) {
+    lastMode = mode;
+    const f = readForm(), seq = ++renderSeq;
     const tbody = document.getElementById('resBody');
-    tbody.innerHTML = '';
-
-    let comp = checkCompliance(pkg);
-
-    Object.keys(DATA.channels).forEach(chName => {
-      const conf = DATA.channels[chName];
-      if(!conf.allow_wh.includes(whCode)) return;
-
-      if(chName.includes("UNIUNI") && comp.status.uniuni.startsWith("NO")) return;
-      if(chName.includes("USPS") && comp.status.usps.startsWith("NO")) return;
-      if(chName.includes("XLmiles") && comp.status.xl.startsWith("NO")) return;
-      if(chName.includes("FedEx") && !chName.includes("超大") && (pkg.Wt > 150 || pkg.L > 108)) return;
-
-      let finalWt = Math.max(pkg.Wt, dimWt);
-      if(!chName.includes("XLmiles")) finalWt = Math.ceil(finalWt);
-
-      let zone = calcZone(zip, whCode, conf);
-      let svcTag = "";
-      let priceList = (DATA.tiers[tier][chName] || {}).prices || [];
-      let basePrice = 0;
-
-      // XLmiles Special Lookup
-      if (chName.includes("XLmiles")) {
-        let xl = getXLService(pkg.L, pkg.W, pkg.H, pkg.Wt);
-        svcTag = `<br><small class="text-primary">${xl.name}</small>`;
-        
-        // XLmiles JSON struct: [{service: 'AH', w: 70, 1: 26.64...}, ...]
-        // Filter by service type first!
-        let row = priceList.find(r => r.service === xl.code && r.w >= finalWt - 0.001);
-        if(row) basePrice = row[zone] || row[6] || 0; // Fallback Zone 6
-      } else {
-        // Standard Lookup
-        let row = priceList.find(r => r.w >= finalWt - 0.001);
-        if(row) basePrice = row[zone] || row[8] || 0;
-      }
-
-      if(basePrice <= 0) return;
+    document.getElementById('resTierBadge').innerText = f.tier;
+    if (mode === 'shop') f.whs = Object.keys(DATA.warehouses).sort();
+    return calc(mode, f).then(quotes => {
+      if (seq !== renderSeq) return;
+      if (mode === 'shop') renderShop(tbody, f.whs.length, quotes, f.pieces);
+      else renderQuotes(tbody, quotes, f.pieces);
+    }, err => {
+      if (seq !== renderSeq) return;
+      tbody.innerHTML = `<tr><td colspan="7" class="text-center py-4 text-danger">数据加载失败: ${err.message}</td></tr>`;
+    });
+  }
+  document.getElementById('btnCalc').onclick = () => requestQuote('quote');
+  document.getElementById('btnShop').onclick = () => requestQuote('shop');
 
-      let surcharges = 0;
-      let details = [];
+  function showPkgInfo(pieces, suffix) {
+    let info;
+    if (pieces.length === 1 && pieces[0].qty === 1) {
+      const pkg = pieces[0];
+      let dimWt = (pkg.L * pkg.W * pkg.H) / 222;
+      info = `<b>Pkg:</b> ${pkg.L}x${pkg.W}x${pkg.H}" | 实重:${pkg.Wt} | 体积重:${dimWt.toFixed(2)}`;
+    } else {
+      let count = 0, wt = 0, dimWt = 0;
+      pieces.forEach(p => { count += p.qty; wt += p.qty * p.Wt; dimWt += p.qty * (p.L * p.W * p.H) / 222; });
+      info = `<b>多件:</b> ${count} 箱 (${pieces.length} 种箱规) | 总实重:${+wt.toFixed(2)} | 总体积重:${dimWt.toFixed(2)}`;
+    }
+    document.getElementById('pkgInfo').innerHTML = info + (suffix || '');
+  }
 
-      if(isRes && conf.fees.res > 0) {
-        surcharges += conf.fees.res;
-        details.push(`住宅 $${conf.fees.res}`);
-      }
-      if(sigOn && conf.fees.sig > 0) {
-        surcharges += conf.fees.sig;
-        details.push(`签名 $${conf.fees.sig}`);
-      }
+  const NO_QUOTES = `<tr><td colspan="7" class="text-center py-4 text-danger">无可用报价</td></tr>`;
 
-      if(conf.fuel_mode !== 'none' && conf.fuel_mode !== 'included') {
-        let rate = fuelRateInput / 100;
-        let tag = "";
-        if (conf.fuel_mode === 'discount_85') {
-            rate = rate * 0.85; 
-            tag = " (85折)";
-        }
-        let fuelAmt = (basePrice + surcharges) * rate;
-        surcharges += fuelAmt;
-        details.push(`燃油${tag} ${(rate*100).toFixed(2)}%: $${fuelAmt.toFixed(2)}`);
-      } else if (conf.fuel_mode === 'included') {
-        details.push(`燃油: 已含`);
-      }
+  // 整表拼成一个字符串只写一次 innerHTML (逐行 += 每次都会重新解析整个表格)
+  function renderQuotes(tbody, quotes, pieces) {
+    showPkgInfo(pieces);
+    tbody.innerHTML = quotes.map(q => quoteRowHtml(q, q.chName, '<span class="status-ok">✔</span>')).join('') || NO_QUOTES;
+  }
 
-      let total = basePrice + surcharges;
+  function renderShop(tbody, whCount, quotes, pieces) {
+    showPkgInfo(pieces, ` | 多仓比价: ${whCount} 个仓库, ${quotes.length} 个可用组合`);
+    tbody.innerHTML = quotes.map((q, i) => quoteRowHtml(q,
+      `${q.chName}<br><small class="text-muted">🏭 ${DATA.warehouses[q.wh].name}</small>`,
+      i === 0 ? '<span class="status-ok">🏆 #1</span>' : `<span class="text-muted">#${i + 1}</span>`)).join('') || NO_QUOTES;
+  }
 
-      tbody.innerHTML += `
+  function quoteRowHtml(q, label, status) {
+    return `
         <tr>
-          <td class="fw-bold text-start">${chName} ${svcTag}</td>
-          <td><span class="badge bg-light text-dark border">Z${zone}</span></td>
-          <td>${finalWt}</td>
-          <td>$${basePrice.toFixed(2)}</td>
-          <td class="small text-muted" style="line-height:1.2">${details.join('<br>') || '-'}</td>
-          <td class="text-end price-main">$${total.toFixed(2)}</td>
-          <td class="text-center"><span class="status-ok">✔</span></td>
+          <td class="fw-bold text-start">${label} ${q.svcTag}</td>
+          <td><span class="badge bg-light text-dark border">Z${q.zone}</span></td>
+          <td>${q.finalWt}</td>
+          <td>$${q.basePrice.toFixed(2)}</td>
+          <td class="small text-muted" style="line-height:1.2">${q.lines ? q.details.join('<br>') + piecesHtml(q.lines) : q.details.join('<br>') || '-'}</td>
+          <td class="text-end price-main">$${q.total.toFixed(2)}</td>
+          <td class="text-center">${status}</td>
         </tr>
       `;
+  }
+
+  // 多件货逐行明细: 箱数 × 每箱费用 (计费重)
+  function piecesHtml(lines) {
+    return '<div class="border-top mt-1 pt-1">' +
+      lines.map(l => `${l.qty}箱 × $${l.total.toFixed(2)} (${+l.finalWt.toFixed(2)}lb)`).join('<br>') + '</div>';
+  }
+
+  // 离线缓存: Service Worker 预缓存页面/样式/数据分片, 再次打开直接读缓存; file:// 打开时不可用, 跳过
+  if ('serviceWorker' in navigator && /^https?:$/.test(location.protocol)) {
+    const hadController = !!navigator.serviceWorker.controller;
+    navigator.serviceWorker.register('__SW_FILE__').catch(() => {});
+    // 新构建的缓存就绪后接管本页; 本页仍是旧版本, 提示刷新 (不自动刷新, 以免丢掉已填的内容)
+    navigator.serviceWorker.addEventListener('controllerchange', () => {
+      if (hadController) document.getElementById('updateTime').innerText += ' · 价格已更新, 刷新页面后生效';
     });
-    
-    if(tbody.innerHTML === '') {
-        tbody.innerHTML = `<tr><td colspan="7" class="text-center py-4 text-danger">无可用报价</td></tr>`;
-    }
-  };
+  }
 </script>
-<script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
 </body>
 </html>
 """
 
+# Service Worker: 预缓存清单 [地址, 内容哈希] 由 write_service_worker 填入.
+# 缓存键 = 地址 + ?__rev=哈希: 新构建只下载哈希变了的条目, 其余直接沿用; 清单之外的旧条目在激活时删除
+SW_TEMPLATE = r"""// 由 generate.py 生成, 勿手工修改
+// PRECACHE: 安装时即下载的外壳 (页面 + 本地化资源); RUNTIME: 数据分片, 页面首次请求时才下载并存入缓存.
+// 两者都以内容哈希作缓存键, 新版本只重新下载内容变化的文件
+const PRECACHE = __PRECACHE__;
+const RUNTIME = __RUNTIME__;
+const CACHE = 'quote-precache-v1';
+const SCOPE = self.registration.scope;
+const keyOf = ([url, rev]) => {
+  const href = new URL(url, SCOPE).href;
+  return [href, href + '?__rev=' + rev];
+};
+const SHELL = new Map(PRECACHE.map(keyOf));
+const KEYS = new Map([...SHELL, ...RUNTIME.map(keyOf)]);
+
+self.addEventListener('install', e => {
+  e.waitUntil(caches.open(CACHE).then(cache => Promise.all([...SHELL].map(([href, key]) =>
+    cache.match(key).then(hit => hit || fetch(href, { cache: 'no-cache' }).then(r => {
+      if (!r.ok) throw new Error(`${href}: HTTP ${r.status}`);
+      return cache.put(key, r);
+    }))
+  ))).then(() => self.skipWaiting()));
+});
+
+// 只保留当前清单里的键: 未变的分片沿用旧缓存, 变化或已删除的分片清掉
+self.addEventListener('activate', e => {
+  const live = new Set(KEYS.values());
+  e.waitUntil(caches.open(CACHE)
+    .then(cache => cache.keys().then(reqs => Promise.all(reqs.filter(r => !live.has(r.url)).map(r => cache.delete(r)))))
+    .then(() => self.clients.claim()));
+});
+
+// 清单内的地址一律先读缓存 (页面本身也是, 新版本在下次打开时生效), 未命中时走网络并存入; 其余请求照常走网络
+self.addEventListener('fetch', e => {
+  if (e.request.method !== 'GET') return;
+  const url = new URL(e.request.url);
+  url.search = ''; url.hash = '';
+  const href = url.href === SCOPE ? new URL('index.html', SCOPE).href : url.href;
+  const key = KEYS.get(href);
+  if (!key) return;
+  e.respondWith(caches.open(CACHE).then(cache => cache.match(key).then(hit => hit || fetch(e.request).then(r => {
+    if (r.ok) cache.put(key, r.clone()).catch(() => {});
+    return r;
+  }))));
+});
+"""
+
 # ==========================================
 # 3. 后端处理 (PDF读取 + GOFO表扫描)
 # ==========================================
 
 def clean_num(val):
+    import pandas as pd
     if pd.isna(val): return 0.0
     s = str(val).replace('$', '').replace(',', '').strip()
     try:
@@ -536,11 +979,77 @@ def find_sheet_name(xl, keywords, exclude_keywords=None):
         return sheet
     return None
 
-def extract_fuel_rate(xl):
-    for sheet in xl.sheet_names:
+class TierWorkbook:
+    """一个报价工作簿: 渠道->Sheet 只解析一次, 每个 Sheet 最多解码一次, 供燃油/邮编库/价格提取共享"""
+
+    def __init__(self, path):
+        # pandas 导入较慢, 只在真正需要解析 Excel 时加载 (缓存全部命中时不加载)
+        import pandas as pd
+        self.path = path
+        self.xl = pd.ExcelFile(path)
+        self.sheet_names = self.xl.sheet_names
+        self.parse_counts = {}
+        self.parse_seconds = {}
+        self._frames = {}
+        self._resolved = {}
+
+    def find_sheet(self, keywords, exclude_keywords=None):
+        key = (tuple(keywords), tuple(exclude_keywords or ()))
+        if key not in self._resolved:
+            self._resolved[key] = find_sheet_name(self, keywords, exclude_keywords)
+        return self._resolved[key]
+
+    def channel_sheet(self, ch_key):
+        conf = CHANNEL_CONFIG[ch_key]
+        return self.find_sheet(conf["keywords"], conf.get("exclude"))
+
+    def sheet(self, name):
+        if name not in self._frames:
+            self.parse_counts[name] = self.parse_counts.get(name, 0) + 1
+            t0 = time.perf_counter()
+            self._frames[name] = self.xl.parse(sheet_name=name, header=None)
+            self.parse_seconds[name] = self.parse_seconds.get(name, 0.0) + time.perf_counter() - t0
+        return self._frames[name]
+
+    def rows(self, name):
+        # 流式逐行读取 (openpyxl 只读模式, 不落 DataFrame), 单元格按 pandas 同样规则转换; 计一次解码
+        from openpyxl.cell.cell import ERROR_CODES
+        self.parse_counts[name] = self.parse_counts.get(name, 0) + 1
+        ws = self.xl.book[name]
+        ws.reset_dimensions()
+        t0 = time.perf_counter()
+        for row in ws.iter_rows(values_only=True):
+            values = [_cell_value(v, ERROR_CODES) for v in row]
+            while values and values[-1] == "": values.pop()
+            self.parse_seconds[name] = self.parse_seconds.get(name, 0.0) + time.perf_counter() - t0
+            yield values
+            t0 = time.perf_counter()
+
+    def put_frame(self, name, data):
+        # rows() 读出的部分行 -> 与 sheet() 相同的 DataFrame (裁掉尾部空行, 各行补齐到最大列数)
+        import pandas as pd
+        from pandas.io.parsers import TextParser
+        while data and not data[-1]: data.pop()
+        width = max((len(row) for row in data), default=0)
+        data = [row + [""] * (width - len(row)) for row in data]
+        self._frames[name] = TextParser(data, header=None, skip_blank_lines=False).read() if data else pd.DataFrame()
+
+    def close(self):
+        self._frames.clear()
+        self.xl.close()
+
+def _cell_value(v, error_codes):
+    # 与 pandas 的 openpyxl 读取一致: 空 -> "", 错误值 -> NaN, 整数值的浮点 -> int
+    if v is None: return ""
+    if type(v) is float: return int(v) if v.is_integer() else v
+    if type(v) is str and v in error_codes: return np.nan
+    return v
+
+def extract_fuel_rate(wb):
+    for sheet in wb.sheet_names:
         if "MT" in sheet.upper(): 
             try:
-                df = pd.read_excel(xl, sheet_name=sheet, header=None)
+                df = wb.sheet(sheet)
                 for r in range(min(150, df.shape[0])):
                     for c in range(df.shape[1]):
                         val = str(df.iloc[r, c])
@@ -549,126 +1058,324 @@ def extract_fuel_rate(xl):
                                 rate_val = str(df.iloc[r, c+1]).replace('%', '').strip()
                                 try:
                                     f = float(rate_val)
+                                    if not np.isfinite(f): continue  # 空单元格读作 "nan", 不算费率
                                     if f > 1: f = f / 100.0
                                     return f
                                 except: pass
             except: pass
     return 0.0
 
-def load_gofo_zip_db(tier_file):
-    db = {}
-    path = os.path.join(DATA_DIR, tier_file)
-    if not os.path.exists(path): return db
+def empty_zip_db():
+    db = {"zip": np.zeros(0, dtype=np.int32)}
+    for field, table in (("city", "cities"), ("state", "states"), ("region", "regions")):
+        db[field], db[table] = np.zeros(0, dtype=np.uint8), []
+    return db
+
+_ZIP_FIELDS = (("city", "cities"), ("state", "states"), ("region", "regions"))
+_ZIP5_FULL_RE = re.compile(r'[0-9]{5}')
+ZIP_BATCH_ROWS = 8192  # 邮编表按批归一化的行数
+
+def _zip_batch(rows, cols, tables):
+    # 一批原始行 -> (int32 邮编, 各字段的出现序编号); 无效邮编记 -1, tables: 字段 -> {字符串: 编号}
+    # 与逐格 str(cell).strip() 一致: 空单元格记 "nan"
+    text = lambda row, c: str(row[c]).strip() if c is not None and c < len(row) and row[c] != "" else "nan"
+    keys = np.full(len(rows), -1, dtype=np.int32)
+    for i, row in enumerate(rows):
+        z = text(row, cols['zip']).split('.')[0].strip().zfill(5)
+        if _ZIP5_FULL_RE.fullmatch(z): keys[i] = int(z)
+    codes = []
+    for field, _ in _ZIP_FIELDS:
+        seen, c = tables[field], cols.get(field)
+        texts = (text(row, c) for row in rows)
+        codes.append(np.fromiter((seen.setdefault(t, len(seen)) for t in texts), dtype=np.int32, count=len(rows)))
+    return keys, codes
+
+def _dict_remap(codes, seen):
+    # 出现序编号 -> (小整数编码, 去重排序后的字符串表); 只保留用到的字符串
+    strings = np.asarray(sorted(seen, key=seen.get), dtype=str)
+    used, inverse = np.unique(codes, return_inverse=True)
+    order = np.argsort(strings[used], kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    dtype = np.uint8 if len(used) <= 256 else np.uint16 if len(used) <= 65536 else np.int32
+    return rank[inverse.reshape(-1)].astype(dtype), strings[used][order].tolist()
+
+def load_gofo_zip_db(wb):
+    # 字典编码的邮编库: 有序 int32 邮编 + 城市/州/大区的小整数编码及各自的字符串表
+    # 邮编表可达数万行: openpyxl 只读模式流式读取, 只取 4 列并按批归一化, 内存只随邮编数而非整表增长;
+    # 同一 Sheet 上的价格表 (表头以下各行清空邮编表的 4 列, 其余列原样保留) 顺带交给 wb, 不再整表解码一次;
+    # 邮编表在价格表左侧/右侧/中间均可
+    db = empty_zip_db()
     try:
-        xl = pd.ExcelFile(path)
-        sheet_name = find_sheet_name(xl, ["GOFO", "报价"], ["UNIUNI", "MT"])
+        sheet_name = wb.find_sheet(["GOFO", "报价"], ["UNIUNI", "MT"])
         if not sheet_name: return db
-        df = pd.read_excel(xl, sheet_name=sheet_name, header=None)
-        
-        start_row = -1
-        cols = {}
-        for r in range(min(200, df.shape[0])):
-            row_vals = [str(x).strip() for x in df.iloc[r].values]
-            if "目的地邮编" in row_vals or "GOFO_大区" in row_vals:
-                start_row = r
-                for c, v in enumerate(row_vals):
-                    if "邮编" in v: cols['zip'] = c
-                    elif "城市" in v: cols['city'] = c
-                    elif "省州" in v: cols['state'] = c
-                    elif "大区" in v: cols['region'] = c
-                break
-        
-        if start_row != -1 and 'zip' in cols:
-            for r in range(start_row+1, len(df)):
-                try:
-                    raw_zip = str(df.iloc[r, cols['zip']])
-                    z = raw_zip.split('.')[0].strip().zfill(5)
-                    if len(z) == 5 and z.isdigit():
-                        db[z] = {
-                            "city": str(df.iloc[r, cols.get('city', -1)]).strip(),
-                            "state": str(df.iloc[r, cols.get('state', -1)]).strip(),
-                            "region": str(df.iloc[r, cols.get('region', -1)]).strip(),
-                            "cn_state": US_STATES_CN.get(str(df.iloc[r, cols.get('state', -1)]).strip(), "")
-                        }
-                except: continue
-        print(f"  [Info] GOFO Zip DB loaded: {len(db)} entries")
+
+        cols, header_seen = None, False
+        frame, blank = [], 0
+        batch, parts = [], []
+        tables = {field: {} for field, _ in _ZIP_FIELDS}
+        for r, row in enumerate(wb.rows(sheet_name)):
+            if cols is not None:
+                batch.append(row)
+                if len(batch) >= ZIP_BATCH_ROWS:
+                    parts.append(_zip_batch(batch, cols, tables))
+                    batch = []
+                # 价格表只清空邮编表所在的列; 全空行先计数, 有后续内容时再补上 (尾部空行丢弃)
+                row = ["" if c in zip_cols else v for c, v in enumerate(row)]
+                while row and row[-1] == "": row.pop()
+                if not row:
+                    blank += 1
+                    continue
+            frame.extend([] for _ in range(blank))
+            frame.append(row)
+            blank = 0
+            if not header_seen and r < 200:
+                row_vals = [str(x).strip() for x in row]
+                if "目的地邮编" in row_vals or "GOFO_大区" in row_vals:
+                    header_seen, found = True, {}
+                    for c, v in enumerate(row_vals):
+                        if "邮编" in v: found['zip'] = c
+                        elif "城市" in v: found['city'] = c
+                        elif "省州" in v: found['state'] = c
+                        elif "大区" in v: found['region'] = c
+                    if 'zip' in found: cols, zip_cols = found, set(found.values())
+        wb.put_frame(sheet_name, frame)
+
+        if batch: parts.append(_zip_batch(batch, cols, tables))
+        if parts:
+            keys = np.concatenate([k for k, _ in parts])
+            ok = keys >= 0
+            keys = keys[ok]
+            # 同一邮编出现多次时以最后一行为准
+            uniq, last = np.unique(keys[::-1], return_index=True)
+            rows = np.flatnonzero(ok)[len(keys) - 1 - last]
+            db["zip"] = uniq.astype(np.int32)
+            for k, (field, table) in enumerate(_ZIP_FIELDS):
+                codes = np.concatenate([c[k] for _, c in parts])[rows]
+                db[field], db[table] = _dict_remap(codes, tables[field])
+        print(f"  [Info] GOFO Zip DB loaded: {len(db['zip'])} entries")
     except Exception as e:
         print(f"  [Err] Failed to load GOFO Zip DB: {e}")
     return db
 
-def load_fedex_pdf_zips():
-    remote_zips = set()
-    extended_zips = set()
-    pdf_files = ["FGE_DAS_Contiguous_Extended_Alaska_Hawaii_2025.pdf", "FGE_DAS_Zip_Code_Changes_2025.pdf"]
-    
-    for pdf in pdf_files:
+# --- FedEx DAS PDF: 按页并行抽取, 按章节分类 ---
+DAS_PAGE_WORKERS = min(8, os.cpu_count() or 1)
+_ZIP5_RE = re.compile(r'\b(\d{5})\b')
+# 清单名称 -> DAS 类别 (主表章节标题与变更表里的 "... LIST" 共用)
+_DAS_LIST_NAMES = (
+    (r'CONTIGUOUS U\.?\s*S\.?:?\s*EXTENDED', "extended"),
+    (r'CONTIGUOUS U\.?\s*S\.?', "remote"),
+    (r'ALASKA', "alaska"),
+    (r'HAWAII', "hawaii"),
+)
+
+def _das_list(name):
+    for pattern, cat in _DAS_LIST_NAMES:
+        if re.fullmatch(pattern, name.strip(), re.I): return cat
+    return None
+
+def das_section(line):
+    # 章节标题 -> (移出的类别, 加入的类别); 非标题行返回 None
+    # 主表: "Delivery Area Surcharge ZIP codes: Contiguous U.S.: Extended (cont.)"
+    m = re.search(r'ZIP codes:\s*(.+?)(?:\s*\(cont\.\))?\s*$', line, re.I)
+    if m:
+        cat = _das_list(m.group(1))
+        return (None, cat) if cat else None
+    # 变更表: "MOVED FROM ... LIST TO ... LIST:" / "ADDED TO ... LIST:" / "REMOVED FROM ... LIST:"
+    m = re.match(r'\s*MOVED FROM (.+?) LIST TO (.+?) LIST', line, re.I)
+    if m:
+        src, dst = _das_list(m.group(1)), _das_list(m.group(2))
+        return (src, dst) if src and dst else None
+    m = re.match(r'\s*ADDED TO (.+?) LIST', line, re.I)
+    if m and _das_list(m.group(1)): return (None, _das_list(m.group(1)))
+    m = re.match(r'\s*REMOVED FROM (.+?) LIST', line, re.I)
+    if m and _das_list(m.group(1)): return (_das_list(m.group(1)), None)
+    return None
+
+def pdf_page_count(path):
+    try:
+        out = subprocess.check_output(["pdfinfo", path], stderr=subprocess.DEVNULL).decode("utf-8", "replace")
+    except (OSError, subprocess.CalledProcessError):
+        return 0
+    m = re.search(r'^Pages:\s*(\d+)', out, re.M)
+    return int(m.group(1)) if m else 0
+
+def das_page_segments(path, page=None):
+    # 逐行读取 pdftotext 输出 (不整页缓冲) -> [(章节, [邮编])]; 本页第一个标题之前的邮编章节记为 None
+    cmd = ["pdftotext", path, "-"] if page is None else ["pdftotext", "-f", str(page), "-l", str(page), path, "-"]
+    segments = [(None, [])]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as proc:
+        for raw in proc.stdout:
+            line = raw.decode("utf-8", "replace")
+            section = das_section(line)
+            if section:
+                segments.append((section, []))
+            else:
+                segments[-1][1].extend(_ZIP5_RE.findall(line))
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return [(s, z) for s, z in segments if s or z]
+
+def extract_das_pages(pdf, use_cache=True):
+    # 每页一条缓存, 键为文件内容哈希 + 页码; 页数未知 (无 pdfinfo) 时整份当作一页
+    path = os.path.join(DATA_DIR, pdf)
+    digest = file_sha256(path)
+    pages = list(range(1, pdf_page_count(path) + 1)) or [None]
+
+    def one(page):
+        name = f"das:{pdf}:{page or 'all'}"
+        key = hashlib.sha256(f"{name}|v{PARSER_VERSION}|{digest}".encode("utf-8")).hexdigest()
+        if use_cache:
+            hit, value = cache_load(name, key)
+            if hit: return value, True
+        value = das_page_segments(path, page)
+        if use_cache: cache_store(name, key, value)
+        return value, False
+
+    with ThreadPoolExecutor(max_workers=DAS_PAGE_WORKERS) as pool:
+        results = list(pool.map(one, pages))
+    print(f"  [OK] {pdf}: {len(pages)} pages ({sum(hit for _, hit in results)} cached)")
+    return [segments for segments, _ in results]
+
+def load_fedex_pdf_zips(use_cache=True):
+    das = {cat: set() for cat in DAS_CATEGORIES}
+    errors = 0
+    unclassified = 0
+    page_counts = {}
+    # 先读主表, 再按顺序套用变更表的新增/移除/迁移
+    for pdf in DAS_PDF_FILES:
         path = os.path.join(DATA_DIR, pdf)
         if not os.path.exists(path): continue
         try:
-            txt = subprocess.check_output(["pdftotext", path, "-"], stderr=subprocess.DEVNULL).decode('utf-8')
-            zips = re.findall(r'\b\d{5}\b', txt)
-            for z in zips: remote_zips.add(z) # 简化：全部视为Remote
-        except:
+            pages = extract_das_pages(pdf, use_cache)
+            page_counts[pdf] = len(pages)
+        except Exception:
+            errors += 1
             print(f"  [Warn] PDF read failed: {pdf}")
-    return list(remote_zips), list(extended_zips)
+            continue
+        current = None
+        for segments in pages:
+            heads = [s for s, _ in segments if s]
+            for section, zips in segments:
+                if section is None:
+                    # 标题前的邮编: 本页只有一个标题 (页眉) 时归入该章节, 否则沿用上一页的章节
+                    section = heads[0] if len(heads) == 1 else current
+                else:
+                    current = section
+                if section is None:
+                    # 找不到章节时按旧逻辑视为 Remote
+                    unclassified += len(zips)
+                    section = (None, "remote")
+                drop, add = section
+                for z in zips:
+                    if drop: das[drop].discard(z)
+                    if add: das[add].add(z)
+    if unclassified:
+        print(f"  [Warn] {unclassified} DAS zips outside any known section, treated as remote")
+    if any(das.values()):
+        print("  [OK] FedEx DAS: " + ", ".join(f"{cat} {len(das[cat])}" for cat in DAS_CATEGORIES))
+    result = {cat: sorted(das[cat]) for cat in DAS_CATEGORIES}
+    result["errors"] = errors
+    result["metrics"] = {"rows": sum(len(das[cat]) for cat in DAS_CATEGORIES), "pages": page_counts,
+                         "by_category": {cat: len(das[cat]) for cat in DAS_CATEGORIES}}
+    return result
+
+# --- 列式解析工具: 与逐格 str(cell) / float() 的结果保持一致 ---
+_ASCII_FLOAT_RE = r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'
+
+def _str_col(col):
+    # 等价于逐格 str(cell); 空单元格记为 "" (原 "nan"/"None" 不含任何关键字或数字)
+    return col.astype(str).astype(object).where(col.notna(), "")
+
+def _str_frame(df):
+    # 表头扫描用: 整块转为小写字符串
+    return df.apply(lambda c: _str_col(c).str.lower())
+
+def _parse_floats(strs):
+    # 纯 ASCII 数字走 NumPy 批量转换 (与 float() 逐位一致), 其余 (inf/下划线/全角数字/文字) 逐个交给 float()
+    out = np.full(len(strs), np.nan)
+    fast = strs.str.fullmatch(_ASCII_FLOAT_RE).to_numpy(dtype=bool, na_value=False)
+    if fast.any():
+        out[fast] = strs[fast].to_numpy(dtype=str).astype(np.float64)
+    for i in np.flatnonzero(~fast & (strs != "").to_numpy(dtype=bool, na_value=False)):
+        try:
+            out[i] = float(strs.iat[i])
+        except ValueError:
+            pass
+    return out
+
+def _clean_num_col(col):
+    # clean_num 的列式版本: 去掉 $ 与千分位后转数字, 无法解析或非有限值 (nan/inf) 记 0
+    from pandas.api.types import infer_dtype
+    if infer_dtype(col, skipna=True) in ("floating", "integer", "mixed-integer-float", "empty"):
+        # 纯数值列无需经过字符串 (float(str(v)) == v)
+        return np.nan_to_num(col.to_numpy(dtype=np.float64, na_value=np.nan), nan=0.0, posinf=0.0, neginf=0.0)
+    strs = _str_col(col).str.replace('$', '', regex=False).str.replace(',', '', regex=False).str.strip()
+    return np.nan_to_num(_parse_floats(strs), nan=0.0, posinf=0.0, neginf=0.0)
+
+def _ffill(values, initial):
+    # 对象数组前向填充: None 沿用上一个非空值, 开头缺省为 initial
+    idx = np.where(values != None, np.arange(len(values)), -1)
+    idx = np.maximum.accumulate(idx) if len(idx) else idx
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+
+def _build_entries(w, zone_cols, svc=None):
+    # zone_cols: [(zone, 价格数组)], 仅保留 >0 的分区价格
+    cols = [(z, p.tolist(), (p > 0).tolist()) for z, p in zone_cols]
+    w = w.tolist()
+    svc = svc.tolist() if svc is not None else None
+    prices = []
+    for i in range(len(w)):
+        entry = {'service': svc[i], 'w': w[i]} if svc is not None else {'w': w[i]}
+        for z, p, ok in cols:
+            if ok[i]: entry[z] = p[i]
+        prices.append(entry)
+    return prices
 
 def extract_prices(df, split_side=None, channel_name=""):
     if df is None: return []
     
     # === XLmiles 专用解析器 ===
     if "XLmiles" in channel_name:
-        prices = []
         # XLmiles 结构: Col 0=Service, Col 2=Weight, Col 3-6=Zone
         # 扫描前20行找 Header
-        h_row = -1
+        top = _str_frame(df.iloc[:20])
+        has_zone = top.apply(lambda c: c.str.contains("zone", regex=False)).to_numpy(dtype=bool)
+        hits = np.flatnonzero(has_zone.any(axis=1))
+        if len(hits) == 0: return []
+        h_row = int(hits[0])
         z_map = {}
-        for r in range(20):
-            row_vals = [str(x).lower() for x in df.iloc[r].values]
-            if any("zone" in x for x in row_vals):
-                h_row = r
-                for c, v in enumerate(row_vals):
-                    m = re.search(r'zone\D*(\d+)', v)
-                    if m: z_map[int(m.group(1))] = c
-                break
+        for c, v in enumerate(top.iloc[h_row].tolist()):
+            m = re.search(r'zone\D*(\d+)', v)
+            if m: z_map[int(m.group(1))] = c
         
-        if h_row == -1 or not z_map: return []
+        if not z_map or df.shape[1] < 3: return []
+        body = df.iloc[h_row+1:]
         
-        current_service = "AH" # 默认
-        for r in range(h_row+1, len(df)):
-            try:
-                # 识别服务类型
-                svc_raw = str(df.iloc[r, 0])
-                if "AH" in svc_raw: current_service = "AH"
-                elif "OS" in svc_raw: current_service = "OS"
-                elif "OM" in svc_raw: current_service = "OM"
-                
-                # 识别重量范围 (0<重量<=70) -> 取70
-                w_raw = str(df.iloc[r, 2])
-                nums = re.findall(r'(\d+)', w_raw)
-                if not nums: continue
-                w_val = float(nums[-1]) # 取最后一个数字作为上限
-                
-                entry = {'service': current_service, 'w': w_val}
-                for z, c in z_map.items():
-                    p = clean_num(df.iloc[r, c])
-                    if p > 0: entry[z] = p
-                
-                prices.append(entry)
-            except: continue
-        return prices
+        # 识别服务类型: 出现新标记前沿用上一行, 默认 AH
+        svc_raw = _str_col(body.iloc[:, 0])
+        svc = np.select(
+            [svc_raw.str.contains(k, regex=False).to_numpy(dtype=bool) for k in ("AH", "OS", "OM")],
+            ["AH", "OS", "OM"], default=None)
+        svc = _ffill(svc, "AH")
+        
+        # 识别重量范围 (0<重量<=70) -> 取最后一个数字作为上限
+        w_str = _str_col(body.iloc[:, 2]).str.extract(r'(\d+)\D*$', expand=False).fillna("")
+        w_val = _parse_floats(w_str)
+        keep = np.flatnonzero(~np.isnan(w_val))
+        
+        zone_cols = [(z, _clean_num_col(body.iloc[:, c])[keep]) for z, c in z_map.items()]
+        return _build_entries(w_val[keep], zone_cols, svc=svc[keep])
 
     # === 标准渠道解析器 ===
     total_cols = df.shape[1]
     c_start, c_end = 0, total_cols
     
-    weight_indices = []
-    for c in range(total_cols):
-        for r in range(50):
-            val = str(df.iloc[r, c]).lower()
-            if "weight" in val or "重量" in val:
-                if c not in weight_indices: weight_indices.append(c)
-                break
-    weight_indices.sort()
+    top = _str_frame(df.iloc[:200])
+    has_weight = top.apply(lambda c: c.str.contains("weight", regex=False) | c.str.contains("重量", regex=False)).to_numpy(dtype=bool)
+    has_zone = top.apply(lambda c: c.str.contains("zone", regex=False)).to_numpy(dtype=bool)
+
+    weight_indices = np.flatnonzero(has_weight[:50].any(axis=0)).tolist()
     
     if split_side == 'left':
         if len(weight_indices) > 0:
@@ -679,111 +1386,1604 @@ def extract_prices(df, split_side=None, channel_name=""):
         else:
             return [] 
 
-    h_row = -1
+    hits = np.flatnonzero(has_weight[:, c_start:c_end].any(axis=1) & has_zone[:, c_start:c_end].any(axis=1))
+    if len(hits) == 0: return []
+    h_row = int(hits[0])
+
     w_col = -1
     z_map = {}
-
-    for r in range(200): 
-        row_vals = [str(x).lower() for x in df.iloc[r, c_start:c_end].values]
-        has_weight = any('weight' in x or '重量' in x for x in row_vals)
-        has_zone = any('zone' in x for x in row_vals)
-        if has_weight and has_zone:
-            h_row = r
-            break
-    
-    if h_row == -1: return []
-
-    row_dat = df.iloc[h_row]
     for c in range(c_start, c_end):
-        if c >= total_cols: break
-        val = str(row_dat[c]).strip().lower()
+        val = top.iat[h_row, c].strip()
         if ('weight' in val or '重量' in val) and w_col == -1: w_col = c
         m = re.search(r'zone[\D]*(\d+)', val)
         if m: z_map[int(m.group(1))] = c
 
     if w_col == -1 or not z_map: return []
 
-    prices = []
-    for r in range(h_row + 1, len(df)):
-        try:
-            w_raw = df.iloc[r, w_col]
-            w_str = str(w_raw).lower().strip()
-            nums = re.findall(r'[\d\.]+', w_str)
-            if not nums: continue
-            w_val = float(nums[0])
-            if 'oz' in w_str: w_val /= 16.0
-            elif 'kg' in w_str: w_val /= 0.453592
-            
-            if w_val <= 0: continue
-
-            entry = {'w': w_val}
-            valid = False
-            for z, c in z_map.items():
-                p = clean_num(df.iloc[r, c])
-                if p > 0:
-                    entry[z] = p
-                    valid = True
+    body = df.iloc[h_row+1:]
+    w_str = _str_col(body.iloc[:, w_col]).str.lower().str.strip()
+    w_val = _parse_floats(w_str.str.extract(r'([\d\.]+)', expand=False).fillna(""))
+    # 单位换算: oz -> lb, kg -> lb
+    is_oz = w_str.str.contains('oz', regex=False).to_numpy(dtype=bool)
+    is_kg = w_str.str.contains('kg', regex=False).to_numpy(dtype=bool) & ~is_oz
+    w_val[is_oz] /= 16.0
+    w_val[is_kg] /= 0.453592
+
+    zone_cols = [(z, _clean_num_col(body.iloc[:, c])) for z, c in z_map.items()]
+    valid = w_val > 0
+    valid &= np.logical_or.reduce([p > 0 for _, p in zone_cols])
+    keep = np.flatnonzero(valid)
+    keep = keep[np.argsort(w_val[keep], kind='stable')]
+    return _build_entries(w_val[keep], [(z, p[keep]) for z, p in zone_cols])
+
+def process_tier(tier, filename, with_zip_db=False):
+    print(f"Processing {tier}...")
+    result = {"tier_data": None, "gofo_zips": None, "parse_counts": {}, "errors": 0}
+    # 构建报告用: 各步骤耗时, 每个渠道 Sheet 的解析耗时与行数, 每个 Sheet 的解码次数
+    metrics = result["metrics"] = {"rows": 0, "steps": {}, "sheets": {}, "reads": {}}
+    path = os.path.join(DATA_DIR, filename)
+    if not os.path.exists(path):
+        print(f"  [Warn] File not found: {filename}")
+        if with_zip_db: result["gofo_zips"] = empty_zip_db()
+        return result
+
+    tier_data = {}
+    wb = None
+    try:
+        with timed_step(metrics["steps"], "open"):
+            wb = TierWorkbook(path)
+        with timed_step(metrics["steps"], "fuel_rate"):
+            fuel_rate = extract_fuel_rate(wb)
+        # GOFO 邮编库与价格表同在一个 Sheet: 流式读取一次, 价格部分留给后面的价格提取
+        if with_zip_db:
+            with timed_step(metrics["steps"], "zip_db"):
+                result["gofo_zips"] = load_gofo_zip_db(wb)
+
+        for ch_key, conf in CHANNEL_CONFIG.items():
+            sheet = wb.channel_sheet(ch_key)
+            if not sheet: continue
             
-            if valid: prices.append(entry)
-        except: continue
+            sheet_metrics = metrics["sheets"][ch_key] = {"sheet": sheet}
+            with timed_step(sheet_metrics):
+                df = wb.sheet(sheet)
+                prices = extract_prices(df, split_side=conf.get("sheet_side"), channel_name=ch_key)
+            sheet_metrics["rows"] = len(prices)
+            metrics["rows"] += len(prices)
             
-    prices.sort(key=lambda x: x['w'])
-    return prices
+            if prices:
+                tier_data[ch_key] = {
+                    "prices": prices,
+                    "fuel_rate": fuel_rate if conf.get("fuel_calc") == "manual" else 0
+                }
+                print(f"  [OK] {tier} {ch_key}: {len(prices)} rows")
+    except Exception as e:
+        result["errors"] += 1
+        print(f"  [Err] Failed to process {filename}: {e}")
+    finally:
+        if wb is not None:
+            result["parse_counts"] = dict(wb.parse_counts)
+            metrics["reads"] = {name: {"count": n, "wall": round(wb.parse_seconds.get(name, 0.0), 4)}
+                                for name, n in wb.parse_counts.items()}
+            wb.close()
+    if with_zip_db and result["gofo_zips"] is None: result["gofo_zips"] = empty_zip_db()
 
-def main():
-    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
-    
-    print("--- Starting Generation (V2026.10 Final) ---")
-    
-    zip_db = load_gofo_zip_db("T0.xlsx")
-    fedex_remote, fedex_extended = load_fedex_pdf_zips()
-    
+    counts = result["parse_counts"]
+    if counts:
+        print(f"  [Info] {tier} sheets decoded: {len(counts)} (max {max(counts.values())}x per sheet)")
+    result["tier_data"] = tier_data
+    return result
+
+# ==========================================
+# 4. 构建调度 (依赖图 + 进程池)
+# ==========================================
+
+# --- 构建计量: 墙钟/CPU/内存峰值, 结果汇总为 public/build_report.json ---
+def _rss_peak_mb():
+    # 进程启动以来的常驻内存峰值 (Linux 单位 KB, macOS 为字节); Windows 无 resource 模块
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+def _child_cpu():
+    # 已结束子进程 (pdftotext 等) 的 CPU 时间
+    t = os.times()
+    return t.children_user + t.children_system
+
+@contextmanager
+def timed_step(target, key=None):
+    # 记录一段代码的墙钟与 CPU 秒数: 写入 target[key], 未给 key 时直接写入 target
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        entry = target if key is None else target.setdefault(key, {})
+        entry["wall"] = round(time.perf_counter() - wall, 4)
+        entry["cpu"] = round(time.process_time() - cpu, 4)
+
+def run_instrumented(fn, args, profile=False, trace_memory=False):
+    # 在执行阶段的进程内计量 (进程池子进程同样适用), 返回 (结果, 计量)
+    metrics = {"pid": os.getpid()}
+    prof = cProfile.Profile() if profile else None
+    if trace_memory: tracemalloc.start()
+    child_cpu, rss_before = _child_cpu(), _rss_peak_mb()
+    try:
+        with timed_step(metrics):
+            if prof: prof.enable()
+            try:
+                value = fn(*args)
+            finally:
+                if prof: prof.disable()
+        metrics["cpu_children"] = round(_child_cpu() - child_cpu, 4)
+        # ru_maxrss 是整个进程 (串行时为主进程, 并行时为复用的子进程) 至今的峰值, 不是本阶段的用量;
+        # 本阶段把峰值抬高了多少另记 rss_peak_growth_mb (未超过此前峰值为 0), 精确的 Python 分配峰值见 --trace-memory
+        metrics["process_rss_peak_mb"] = _rss_peak_mb()
+        if rss_before is not None:
+            metrics["rss_peak_growth_mb"] = round(metrics["process_rss_peak_mb"] - rss_before, 1)
+        if trace_memory: metrics["py_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    finally:
+        if trace_memory: tracemalloc.stop()
+    if prof:
+        # 原始统计 dict 可 pickle 传回主进程, 也正是 pstats 读取的 marshal 格式
+        prof.create_stats()
+        metrics["profile"] = prof.stats
+    return value, metrics
+
+class BuildReport:
+    """一次构建的计量汇总: 各阶段 (含缓存命中) 与主进程各步骤的耗时/内存/行数"""
+
+    def __init__(self, profile=False, trace_memory=False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.phases = {}
+        self.output = {}
+        self._profiles = {}
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+
+    def phase(self, name):
+        return timed_step(self.phases, name)
+
+    def add_stage(self, name, value, metrics=None, cached=False):
+        entry = dict(metrics or {})
+        profile = entry.pop("profile", None)
+        if profile is not None: self._profiles[name] = profile
+        entry["cached"] = cached
+        entry["errors"] = (value or {}).get("errors", 0)
+        # 阶段自身上报的行数/子步骤 (缓存命中时为生成该缓存那次的数据)
+        entry.update((value or {}).get("metrics") or {})
+        self.stages[name] = entry
+
+    def slowest_stage(self):
+        timed = [(e["wall"], name) for name, e in self.stages.items() if not e["cached"] and "wall" in e]
+        return max(timed)[1] if timed else None
+
+    def write(self, out_dir):
+        slowest = self.slowest_stage()
+        profile_path = os.path.join(out_dir, PROFILE_FILE)
+        if self.profile and slowest in self._profiles:
+            _write_bytes(profile_path, marshal.dumps(self._profiles[slowest]))
+            print(f"  [Profile] {slowest} ({self.stages[slowest]['wall']:.2f}s) -> {profile_path}")
+        else:
+            if self.profile: print("  [Profile] No stage was parsed (all cached?), try --no-cache")
+            # 旧的 profile 与本次报告不对应
+            if os.path.exists(profile_path): os.remove(profile_path)
+            profile_path = None
+
+        report = {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "parser_version": PARSER_VERSION,
+            "wall": round(time.perf_counter() - self._wall, 4),
+            "cpu": round(time.process_time() - self._cpu, 4),
+            "rss_peak_mb": _rss_peak_mb(),
+            "slowest_stage": slowest,
+            "profile": os.path.basename(profile_path) if profile_path else None,
+            "stages": self.stages,
+            "phases": self.phases,
+            "output": self.output,
+        }
+        path = os.path.join(out_dir, REPORT_FILE)
+        _write_bytes(path, json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8"))
+        return path
+
+def _release_meta(release_id):
+    m = _RELEASE_DIR_RE.match(release_id)
+    return {"id": release_id, "start": m.group(1), "end": m.group(2)}
+
+def discover_releases(data_dir=DATA_DIR, warn=True):
+    # data/ 下按日期命名的发布目录 -> [{"id", "start", "end", "files": {等级: 相对 data/ 的路径}}], 按起始日排序
+    # warn=False 供监视模式每轮轮询使用, 无效目录不重复告警
+    releases = []
+    if not os.path.isdir(data_dir): return releases
+    for name in os.listdir(data_dir):
+        m = _RELEASE_DIR_RE.match(name)
+        if not m or not os.path.isdir(os.path.join(data_dir, name)): continue
+        try:
+            start = date.fromisoformat(m.group(1))
+            end = date.fromisoformat(m.group(2)) if m.group(2) else None
+        except ValueError:
+            if warn: print(f"  [Warn] Skipping release {name}: invalid date")
+            continue
+        if end is not None and end < start:
+            if warn: print(f"  [Warn] Skipping release {name}: ends before it starts")
+            continue
+        files = {tier: os.path.join(name, filename) for tier, filename in TIER_FILES.items()
+                 if os.path.exists(os.path.join(data_dir, name, filename))}
+        if files: releases.append(dict(_release_meta(name), files=files))
+    return sorted(releases, key=lambda r: (r["start"], r["id"]))
+
+def build_stages(use_cache=True):
+    # fn/args: 阶段函数; deps: 依赖阶段; default: 失败时结果; cost: 预估耗时权重; inputs: 缓存键对应的输入文件
+    stages = {
+        "fedex_das": {
+            "fn": load_fedex_pdf_zips, "args": (use_cache,), "deps": (),
+            "default": dict({cat: [] for cat in DAS_CATEGORIES}, errors=1),
+            "cost": 0, "inputs": DAS_PDF_FILES,
+        },
+    }
+    for tier, filename in TIER_FILES.items():
+        # GOFO 邮编库随 GOFO_ZIP_TIER 工作簿一起解析, 不再单独打开
+        with_zip_db = tier == GOFO_ZIP_TIER
+        stages[f"tier:{tier}"] = {
+            "fn": process_tier, "args": (tier, filename, with_zip_db), "deps": (),
+            "default": {"tier_data": {}, "gofo_zips": empty_zip_db() if with_zip_db else None, "parse_counts": {}, "errors": 1},
+            "cost": _file_cost(filename), "inputs": (filename,),
+        }
+    # 各发布的工作簿各成一个阶段 (tier:T1@2026-01-05), 同样按内容缓存; 不带邮编库
+    for release in discover_releases():
+        for tier, filename in release["files"].items():
+            stages[f"tier:{tier}@{release['id']}"] = {
+                "fn": process_tier, "args": (tier, filename), "deps": (),
+                "default": {"tier_data": {}, "gofo_zips": None, "parse_counts": {}, "errors": 1},
+                "cost": _file_cost(filename), "inputs": (filename,),
+            }
+    return stages
+
+def _file_cost(filename):
+    path = os.path.join(DATA_DIR, filename)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def _init_worker():
+    # 子进程按行刷新输出, 避免日志乱序堆积
+    sys.stdout.reconfigure(line_buffering=True)
+
+def run_stages(stages, jobs=1, use_cache=True, report=None):
+    results = {}
+    keys = {}
+    pending = {}
+    profile = bool(report and report.profile)
+    trace_memory = bool(report and report.trace_memory)
+    for name, st in stages.items():
+        if use_cache and st.get("inputs") is not None:
+            metrics = {}
+            with timed_step(metrics):
+                keys[name] = stage_cache_key(name, st["inputs"])
+                hit, value = cache_load(name, keys[name])
+            if hit:
+                print(f"  [Cache] {name}")
+                results[name] = value
+                if report: report.add_stage(name, value, metrics, cached=True)
+                continue
+        pending[name] = st
+
+    def finish(name, value, metrics=None, ok=True):
+        results[name] = value
+        if report: report.add_stage(name, value, metrics)
+        # 出错的结果 (如 pdftotext 缺失) 不写缓存, 下次重新解析
+        if ok and name in keys and not value.get("errors"):
+            cache_store(name, keys[name], value)
+
+    # 只剩一个阶段时不值得启动进程池
+    if jobs <= 1 or len(pending) <= 1:
+        for name in _topo_order(pending):
+            st = pending[name]
+            try:
+                finish(name, *run_instrumented(st["fn"], st["args"], profile, trace_memory))
+            except Exception as e:
+                print(f"  [Err] Stage {name} failed: {e}")
+                finish(name, st["default"], ok=False)
+        return results
+
+    running = {}
+    sys.stdout.reconfigure(line_buffering=True)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        while pending or running:
+            # 依赖已满足的阶段按预估耗时从大到小提交, 让最慢的工作簿最先开始
+            ready = [n for n, st in pending.items() if all(d in results for d in st["deps"])]
+            ready.sort(key=lambda n: pending[n]["cost"], reverse=True)
+            for name in ready:
+                st = pending.pop(name)
+                running[pool.submit(run_instrumented, st["fn"], st["args"], profile, trace_memory)] = name
+            if not running:
+                raise RuntimeError(f"Unresolvable stage dependencies: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    finish(name, *fut.result())
+                except Exception as e:
+                    print(f"  [Err] Stage {name} failed: {e}")
+                    finish(name, stages[name]["default"], ok=False)
+    return results
+
+def _topo_order(stages):
+    order, seen = [], set()
+    def visit(name, path=()):
+        if name in seen: return
+        if name in path:
+            raise RuntimeError(f"Cyclic stage dependency: {' -> '.join(path + (name,))}")
+        for dep in stages[name]["deps"]:
+            # 已由缓存命中的依赖不在本轮
+            if dep in stages: visit(dep, path + (name,))
+        seen.add(name)
+        order.append(name)
+    for name in stages:
+        visit(name)
+    return order
+
+# ==========================================
+# 5. 增量构建缓存 (按输入文件内容哈希)
+# ==========================================
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_cache_key(name, inputs):
+    h = hashlib.sha256()
+    h.update(f"{name}|v{PARSER_VERSION}|".encode())
+    # 渠道关键字/分栏配置决定解析结果, 一并计入
+    h.update(json.dumps(CHANNEL_CONFIG, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    for filename in inputs:
+        path = os.path.join(DATA_DIR, filename)
+        digest = file_sha256(path) if os.path.exists(path) else "missing"
+        h.update(f"|{filename}:{digest}".encode("utf-8"))
+    return h.hexdigest()
+
+def _cache_path(name):
+    return os.path.join(CACHE_DIR, re.sub(r'[^\w.-]', '_', name) + ".pkl")
+
+def cache_load(name, key):
+    try:
+        with open(_cache_path(name), "rb") as f:
+            entry = pickle.load(f)
+        if entry.get("key") == key: return True, entry["value"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"  [Warn] Cache entry {name} unreadable: {e}")
+    return False, None
+
+def cache_store(name, key, value):
+    # 每个阶段只保留最新一条, 先写临时文件再原子替换
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump({"key": key, "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"  [Warn] Cache write failed for {name}: {e}")
+        if os.path.exists(tmp): os.remove(tmp)
+
+# ==========================================
+# 6. 输出编码 (列式价格表)
+# ==========================================
+XL_SERVICES = ("AH", "OS", "OM")
+
+def price_columns(prices):
+    # 行式 [{'w':.., zone:..}] -> 列式: 排序后的重量数组 + 每个分区一列 (缺失记 0) + XLmiles 服务编号
+    has_svc = any('service' in r for r in prices)
+    zones = sorted({k for r in prices for k in r if isinstance(k, int)})
+    w = np.array([r['w'] for r in prices], dtype=np.float64)
+    if has_svc:
+        svc = np.array([XL_SERVICES.index(r.get('service', "AH")) for r in prices], dtype=np.uint8)
+        order = np.lexsort((w, svc))
+    else:
+        svc = None
+        order = np.argsort(w, kind='stable')
+    cols = {z: np.array([r.get(z, 0.0) for r in prices], dtype=np.float64)[order] for z in zones}
+    return {"w": w[order], "zones": cols, "svc": svc[order] if has_svc else None}
+
+def _encode_array(a):
+    # 选能无损还原的最窄类型: u1/u2 (服务编号/Zone/字典编码) / i4 (邮编) / f4 / c4 (整分 int32) / f8, 小端 base64
+    if a.dtype == np.uint8:
+        t, data = "u1", a
+    elif a.dtype == np.uint16:
+        t, data = "u2", a.astype('<u2')
+    elif a.dtype.kind in "iu":
+        t, data = "i4", a.astype('<i4')
+    else:
+        f4 = a.astype('<f4')
+        cents = np.round(a * 100)
+        if np.array_equal(f4.astype(np.float64), a):
+            t, data = "f4", f4
+        elif np.all(np.abs(cents) < 2**31) and np.array_equal(cents / 100, a):
+            t, data = "c4", cents.astype('<i4')
+        else:
+            t, data = "f8", a.astype('<f8')
+    return {"t": t, "b": base64.b64encode(data.tobytes()).decode("ascii")}
+
+def encode_price_table(prices):
+    cols = price_columns(prices)
+    table = {
+        "n": len(cols["w"]),
+        "w": _encode_array(cols["w"]),
+        "zones": {str(z): _encode_array(p) for z, p in cols["zones"].items()},
+    }
+    if cols["svc"] is not None:
+        table["services"] = list(XL_SERVICES)
+        table["svc"] = _encode_array(cols["svc"])
+    return table
+
+def encode_tier_data(tier_data):
+    # 页面只带列式表, 行式 prices 仅保留在构建缓存中
+    return {ch: {"table": encode_price_table(v["prices"]), "fuel_rate": v["fuel_rate"]}
+            for ch, v in tier_data.items()}
+
+def _prefix_zone_table(rules, region):
+    # uint8[1001]: 下标 0-999 为 3 位前缀, 下标 1000 为无法解析的前缀 (只会命中默认 Zone)
+    ranges, default = rules.get(region) or rules.get("*") or ([], 8)
+    table = np.full(1001, default, dtype=np.uint8)
+    for lo, hi, zone in reversed(ranges):
+        table[lo:hi + 1] = zone
+    return table
+
+def build_zone_tables(warehouses, zip_db):
+    # 每个仓库 x 分区来源一张前缀表; 有 5 位邮编覆盖的 (GOFO) 再带一列与 zip5_keys 对齐的 Zone,
+    # 读取端展开成 100000 项的整表, 查询只需一次下标访问. 同区域仓库的表相同, 只存一份, 按下标引用
+    keys = zip_db["zip"].astype(np.int64)
+    key_prefix = keys // 100
+    key_region = np.asarray(zip_db["regions"], dtype=object)[zip_db["region"]]
+    tables, seen = [], {}
+    def ref(arr):
+        b = arr.tobytes()
+        if b not in seen:
+            seen[b] = len(tables)
+            tables.append(_encode_array(arr))
+        return seen[b]
+
+    out = {"zip5_keys": _encode_array(keys.astype(np.int32)) if len(keys) else None,
+           "tables": tables, "warehouses": {}}
+    for wh, info in warehouses.items():
+        region = info.get("region")
+        entry = {}
+        for src, rules in ZONE_RULES.items():
+            prefix = _prefix_zone_table(rules, region)
+            entry[src] = {"prefix": ref(prefix)}
+            if src == "gofo" and region in GOFO_LOCAL_REGION and len(keys):
+                local = key_region == GOFO_LOCAL_REGION[region]
+                entry[src]["zip5"] = ref(np.where(local, GOFO_LOCAL_ZONE, prefix[key_prefix]).astype(np.uint8))
+        out["warehouses"][wh] = entry
+    return out
+
+ZIP_BITMAP_BYTES = 100000 // 8
+
+def encode_zip_set(zips):
+    # 5 位邮编集合 -> 连续区间 [起, 止) 的 int32 对, 或 100000 位位图 (小端位序), 取编码更小者
+    keys = np.unique(np.array([int(z) for z in zips], dtype=np.int64))
+    if len(keys) == 0:
+        return {"n": 0, "ranges": _encode_array(np.zeros(0, dtype=np.int32))}
+    breaks = np.flatnonzero(np.diff(keys) != 1) + 1
+    starts = keys[np.r_[0, breaks]]
+    ends = keys[np.r_[breaks - 1, len(keys) - 1]] + 1
+    if len(starts) * 8 < ZIP_BITMAP_BYTES:
+        return {"n": len(keys), "ranges": _encode_array(np.stack([starts, ends], axis=1).ravel().astype(np.int32))}
+    bits = np.zeros(100000, dtype=bool)
+    bits[keys] = True
+    return {"n": len(keys), "bitmap": _encode_array(np.packbits(bits, bitorder="little"))}
+
+def encode_das(das):
+    cats = [c for c in DAS_CATEGORIES if das.get(c)]
+    return {"order": cats, "sets": {c: encode_zip_set(das[c]) for c in cats}}
+
+def encode_zip_db(db):
+    # 州的中文名随州代码表只存一份
+    return {
+        "n": len(db["zip"]),
+        "zip": _encode_array(db["zip"]),
+        "city": _encode_array(db["city"]), "cities": db["cities"],
+        "state": _encode_array(db["state"]), "states": db["states"],
+        "states_cn": [US_STATES_CN.get(s, "") for s in db["states"]],
+        "region": _encode_array(db["region"]), "regions": db["regions"],
+    }
+
+def build_final_data(jobs=1, use_cache=True, report=None):
+    # 页面与 Python 报价引擎 (quote_engine.QuoteEngine) 共用的数据包
+    report = report or BuildReport()
+    with report.phase("stages"):
+        results = run_stages(build_stages(use_cache), jobs=jobs, use_cache=use_cache, report=report)
+    with report.phase("encode"):
+        return encode_final_data(results)
+
+def encode_final_data(results):
     final_data = {
         "warehouses": WAREHOUSE_DB,
         "channels": CHANNEL_CONFIG,
-        "gofo_zips": zip_db,
-        "fedex_das_remote": fedex_remote,
-        "fedex_das_extended": fedex_extended,
-        "tiers": {}
+        "gofo_zips": None,
+        "fedex_das": None,
+        "zone_tables": None,
+        "tiers": {},
+        "rate_versions": None,
     }
+    return patch_final_data(final_data, results, results)
 
-    for tier, filename in TIER_FILES.items():
-        print(f"Processing {tier}...")
-        path = os.path.join(DATA_DIR, filename)
-        if not os.path.exists(path):
-            print(f"  [Warn] File not found: {filename}")
+def patch_final_data(final_data, results, names):
+    # 按阶段重新编码数据包中受影响的部分; 监视模式下只传入本轮重跑的阶段
+    versions_changed = False
+    for name in names:
+        if name == "fedex_das":
+            final_data["fedex_das"] = encode_das(results["fedex_das"])
             continue
-        
-        tier_data = {}
+        if "@" in name:
+            versions_changed = True
+            continue
+        tier = name.split(":", 1)[1]
+        tier_data = results[name]["tier_data"]
+        if tier_data is not None:
+            final_data["tiers"][tier] = encode_tier_data(tier_data)
+        elif not results[name].get("errors"):
+            # 工作簿已删除/改名: 与全量构建一致去掉该等级, 不能继续发布旧价格
+            final_data["tiers"].pop(tier, None)
+        if tier == GOFO_ZIP_TIER:
+            zip_db = results[name]["gofo_zips"] or empty_zip_db()
+            final_data["gofo_zips"] = encode_zip_db(zip_db)
+            final_data["zone_tables"] = build_zone_tables(WAREHOUSE_DB, zip_db)
+    # 任一发布变化都重建整个区间索引 (表去重跨发布进行)
+    if versions_changed:
+        final_data["rate_versions"] = encode_rate_versions(results)
+    # 保持等级顺序与 TIER_FILES 一致
+    final_data["tiers"] = {t: final_data["tiers"][t] for t in TIER_FILES if t in final_data["tiers"]}
+    return final_data
+
+def encode_rate_versions(results):
+    # 各发布的价格表 (内容相同的只存一份) + 区间索引: 每个 等级×渠道 一列断点 {"from": [起始日], "table": [表下标]},
+    # 相邻区间同一张表时合并; 查询时对断点二分, 早于首个断点或无发布覆盖为 -1
+    released = {}
+    for name, result in results.items():
+        if "@" not in name or not result.get("tier_data"): continue
+        tier, release_id = name.split(":", 1)[1].split("@", 1)
+        released.setdefault(release_id, {})[tier] = encode_tier_data(result["tier_data"])
+    if not released: return None
+    releases = sorted((_release_meta(r) for r in released), key=lambda r: (r["start"], r["id"]))
+    span = {r["id"]: (date.fromisoformat(r["start"]), date.fromisoformat(r["end"]) if r["end"] else date.max)
+            for r in releases}
+    # 断点: 各发布的起始日, 以及有截止日的发布结束后的第一天
+    bounds = sorted({start for start, _ in span.values()} |
+                    {end + timedelta(days=1) for _, end in span.values() if end != date.max})
+
+    tables, seen = [], {}
+    def ref(release_id, tier, ch):
+        entry = released[release_id][tier][ch]
+        key = hashlib.sha256(bundle_json(entry).encode("utf-8")).digest()
+        if key not in seen:
+            seen[key] = len(tables)
+            tables.append(dict(entry, tier=tier, channel=ch, release=release_id))
+        return seen[key]
+
+    index = {}
+    for tier in TIER_FILES:
+        for ch in CHANNEL_CONFIG:
+            having = [r["id"] for r in releases if ch in released[r["id"]].get(tier, {})]
+            if not having: continue
+            froms, ids = [], []
+            for day in bounds:
+                covering = [r for r in having if span[r][0] <= day <= span[r][1]]
+                t = ref(covering[-1], tier, ch) if covering else -1
+                if not ids or ids[-1] != t:
+                    froms.append(day.isoformat())
+                    ids.append(t)
+            index.setdefault(tier, {})[ch] = {"from": froms, "table": ids}
+    intervals = sum(len([t for t in v["table"] if t >= 0]) for chans in index.values() for v in chans.values())
+    print(f"  [OK] Rate versions: {len(releases)} releases, {intervals} dated intervals, {len(tables)} unique tables")
+    return {"releases": releases, "index": index, "tables": tables}
+
+# --- 分片输出: 外壳页 + 内容哈希命名的数据分片 (附 .gz/.br) ---
+_SHARD_FILE_RE = re.compile(r'^[\w-]+\.[0-9a-f]{12}\.json(?:\.gz|\.br)?$')
+
+def bundle_json(obj):
+    # 非有限数在解析阶段已清洗为 0, 这里出现即为 bug, 直接报错而不是输出非法 JSON
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False)
+
+def iter_json(obj, depth=2):
+    # 增量编码: 前 depth 层字典逐项输出, 更深的值整段 bundle_json; 结果与 bundle_json(obj) 逐字节相同,
+    # 但任何时刻只有一个分片大小的字符串在内存中
+    if depth and isinstance(obj, dict):
+        yield "{"
+        for i, (k, v) in enumerate(obj.items()):
+            yield (", " if i else "") + bundle_json(k if isinstance(k, str) else str(k)) + ": "
+            yield from iter_json(v, depth - 1)
+        yield "}"
+    else:
+        yield bundle_json(obj)
+
+def zone_tables_for(zone_tables, wh):
+    # 单个仓库用到的分区表, 表下标重新编号
+    entry = zone_tables["warehouses"][wh]
+    used = sorted({i for t in entry.values() for i in t.values()})
+    remap = {old: new for new, old in enumerate(used)}
+    return {
+        "zip5_keys": zone_tables["zip5_keys"] if any("zip5" in t for t in entry.values()) else None,
+        "tables": [zone_tables["tables"][i] for i in used],
+        "warehouses": {wh: {src: {k: remap[i] for k, i in t.items()} for src, t in entry.items()}},
+    }
+
+def split_bundle(final_data):
+    # 外壳页只带仓库/渠道/燃油费率; 价格表按等级、分区表按仓库、GOFO 邮编库与 DAS 各成一片
+    # 分片名与 quote_engine.assemble_bundle 对应
+    shards = {f"tier:{tier}": v for tier, v in final_data["tiers"].items()}
+    for wh in final_data["zone_tables"]["warehouses"]:
+        shards[f"zones:{wh}"] = zone_tables_for(final_data["zone_tables"], wh)
+    shards["gofo_zips"] = final_data["gofo_zips"]
+    shards["fedex_das"] = final_data["fedex_das"]
+    shell = {
+        "warehouses": final_data["warehouses"],
+        "channels": final_data["channels"],
+        "fuel_rates": {tier: {ch: v["fuel_rate"] for ch, v in chans.items()}
+                       for tier, chans in final_data["tiers"].items()},
+    }
+    return shell, shards
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+def _write_chunks(path, chunks):
+    # 先写同目录临时文件再原子改名: 读取方只会看到旧文件或完整的新文件
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def _write_bytes(path, data):
+    _write_chunks(path, (data,))
+
+_ASSET_RE = re.compile(r'href="__ASSET:([\w.-]+)__"')
+
+def _asset_href(name, assets):
+    # 已本地化的用 ASSET_DIR 下的哈希地址; 否则退回 CDN, 并带上固定的 SRI 摘要, 由浏览器校验
+    if (assets or {}).get(name): return f'href="{assets[name]}"'
+    spec = VENDOR_ASSETS[name]
+    return f'href="{spec["url"]}" integrity="{spec["integrity"]}" crossorigin="anonymous"'
+
+def render_template(text, assets=None):
+    # 静态资源占位符 href="__ASSET:名称__"
+    text = text.replace('__SW_FILE__', SW_FILE)
+    return _ASSET_RE.sub(lambda m: _asset_href(m.group(1), assets), text)
+
+def write_html(path, shell, assets=None):
+    # 模板前半 + 增量编码的 JSON + 模板后半, 逐段写入; 不拼整页字符串. 返回写出的字节数
+    # 数据放在 <script type="application/json"> 中, 需转义 "</" 防止提前闭合标签 (字符串整段在同一块内, 不会跨块)
+    head, tail = (render_template(part, assets) for part in HTML_TEMPLATE.split('__JSON_DATA__'))
+    size = 0
+    def chunks():
+        nonlocal size
+        for text in itertools.chain((head,), (c.replace("</", "<\\/") for c in iter_json(shell)), (tail,)):
+            data = text.encode("utf-8")
+            size += len(data)
+            yield data
+    _write_chunks(path, chunks())
+    return size
+
+def _write_hashed(path, body, brotli):
+    # 文件名带内容哈希, 可长期缓存; 同名文件已存在即内容相同, 跳过重写与重新压缩
+    if not os.path.exists(path): _write_bytes(path, body)
+    if not os.path.exists(path + ".gz"): _write_bytes(path + ".gz", gzip.compress(body, 9, mtime=0))
+    if brotli and not os.path.exists(path + ".br"): _write_bytes(path + ".br", brotli.compress(body))
+
+def write_shards(shards):
+    out_dir = os.path.join(OUTPUT_DIR, SHARD_DIR)
+    os.makedirs(out_dir, exist_ok=True)
+    brotli = _brotli()
+    if brotli is None:
+        print("  [Info] brotli not installed, skipping .br shards")
+    urls, total = {}, 0
+    for name, obj in shards.items():
+        body = bundle_json(obj).encode("utf-8")
+        stem = re.sub(r'[^\w-]', '-', name)
+        fname = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}.json"
+        _write_hashed(os.path.join(out_dir, fname), body, brotli)
+        urls[name] = f"{SHARD_DIR}/{fname}"
+        total += len(body)
+    print(f"  [OK] {len(urls)} data shards, {total / 1024:.0f} KB uncompressed")
+    return urls
+
+def prune_shards(urls):
+    # 清掉不再被引用的旧分片; 须在新外壳页替换之后调用, 旧页面在此之前仍能取到分片
+    out_dir = os.path.join(OUTPUT_DIR, SHARD_DIR)
+    keep = {os.path.basename(u) for u in urls.values()}
+    for fname in os.listdir(out_dir):
+        if _SHARD_FILE_RE.match(fname) and fname.split(".json")[0] + ".json" not in keep:
+            os.remove(os.path.join(out_dir, fname))
+
+# --- 静态资源与 Service Worker: 第三方样式本地化, 页面/资源/分片按内容哈希预缓存 ---
+_ASSET_FILE_RE = re.compile(r'^[\w.-]+\.[0-9a-f]{12}\.\w+(?:\.gz|\.br)?$')
+_CSS_COMMENT_RE = re.compile(r'/\*(?!!).*?\*/', re.S)
+
+def minify_css(text):
+    # dist 版本身已压缩; 再去掉普通注释 (含 sourceMappingURL, 不发布 .map), 保留 /*! 版权声明
+    return _CSS_COMMENT_RE.sub("", text).strip()
+
+def _integrity_ok(body, integrity):
+    # integrity 为 SRI 格式 "<算法>-<base64 摘要>", 如 sha384-...
+    algo, _, expected = integrity.partition("-")
+    return base64.b64encode(hashlib.new(algo, body).digest()).decode("ascii") == expected
+
+def vendor_asset(name):
+    # 优先用 VENDOR_DIR 下的副本, 没有则从 CDN 下载一次存入; 都不可用或摘要不符时返回 None, 页面退回 CDN
+    spec = VENDOR_ASSETS[name]
+    path = os.path.join(VENDOR_DIR, name)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            body = f.read()
+        if not _integrity_ok(body, spec["integrity"]):
+            print(f"  [Warn] {path} does not match the pinned hash, ignoring it")
+            return None
+        return body
+    import urllib.request
+    try:
+        with urllib.request.urlopen(spec["url"], timeout=VENDOR_TIMEOUT) as r:
+            body = r.read()
+    except OSError as e:
+        print(f"  [Warn] Cannot download {name} ({e}), page will load it from the CDN")
+        return None
+    if not _integrity_ok(body, spec["integrity"]):
+        print(f"  [Warn] Downloaded {name} does not match the pinned hash, not saving it")
+        return None
+    os.makedirs(VENDOR_DIR, exist_ok=True)
+    _write_bytes(path, body)
+    return body
+
+def write_assets():
+    # 返回 {资源名: ASSET_DIR 下的哈希地址}, 只含已本地化的资源
+    out_dir = os.path.join(OUTPUT_DIR, ASSET_DIR)
+    brotli = _brotli()
+    urls = {}
+    for name in VENDOR_ASSETS:
+        body = vendor_asset(name)
+        if body is None: continue
+        if name.endswith(".css"): body = minify_css(body.decode("utf-8")).encode("utf-8")
+        stem, ext = os.path.splitext(name)
+        fname = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+        os.makedirs(out_dir, exist_ok=True)
+        _write_hashed(os.path.join(out_dir, fname), body, brotli)
+        urls[name] = f"{ASSET_DIR}/{fname}"
+    return urls
+
+def prune_assets(urls):
+    # 同 prune_shards: 新外壳页替换之后再清理旧资源
+    out_dir = os.path.join(OUTPUT_DIR, ASSET_DIR)
+    if not os.path.isdir(out_dir): return
+    keep = {os.path.basename(u) for u in urls.values()}
+    for fname in os.listdir(out_dir):
+        if _ASSET_FILE_RE.match(fname) and re.sub(r'\.(gz|br)$', '', fname) not in keep:
+            os.remove(os.path.join(out_dir, fname))
+
+def write_service_worker(asset_urls, shard_urls):
+    # 安装时只预缓存页面与本地化资源; 数据分片按需请求, 首次请求时再缓存, 不在首次访问时下载整份数据.
+    # 清单按内容哈希 (相对 OUTPUT_DIR), 页面本身文件名固定, 也靠哈希判断是否变化
+    def entries(urls):
+        return [[url, file_sha256(os.path.join(OUTPUT_DIR, url))[:12]] for url in urls]
+    precache, runtime = entries(["index.html"] + sorted(asset_urls)), entries(sorted(shard_urls))
+    _write_bytes(os.path.join(OUTPUT_DIR, SW_FILE),
+                 SW_TEMPLATE.replace("__PRECACHE__", json.dumps(precache))
+                            .replace("__RUNTIME__", json.dumps(runtime)).encode("utf-8"))
+    print(f"  [OK] Service worker: {len(precache)} precached files, {len(runtime)} shards cached on first use")
+    return precache, runtime
+
+# --- 二进制价格库: 全部价格表拼成几个 .npy 数组 + index.json, 分析任务用 np.load(mmap_mode="r") 零拷贝共享 ---
+# 读取端见 quote_engine.RateStore; 布局变更时递增 RATE_STORE_VERSION (两边同步)
+RATE_STORE_VERSION = 2
+NO_SERVICE = 255  # service 数组中非 XLmiles 行的取值
+_RATE_FILE_RE = re.compile(r'^\w+\.[0-9a-f]{12}\.npy$')
+
+def rate_store_arrays(final_data):
+    # 行 = 某等级某渠道的一个重量档; price 每个分区一列 (缺失记 0), table_id 为行所属的 index["tables"] 下标
+    # 先放当前价格表, 再放各发布中内容不同的表 (带 "release"); 区间索引改指向 index["tables"] 下标
+    from quote_engine import decode_price_table
+    labels, encoded, seen = [], [], {}
+    def add(label, v, shared=True):
+        # 当前价格表每个 等级×渠道 各占一项 (按键查找); 发布中的表与已有表内容相同时直接引用
+        key = hashlib.sha256(bundle_json([v["table"], v["fuel_rate"]]).encode("utf-8")).digest()
+        if shared and key in seen: return seen[key]
+        seen.setdefault(key, len(labels))
+        labels.append(label)
+        encoded.append(v)
+        return len(labels) - 1
+    for tier, chans in final_data["tiers"].items():
+        for ch, v in chans.items(): add({"tier": tier, "channel": ch}, v, shared=False)
+    versions = final_data.get("rate_versions")
+    if versions:
+        ids = [add({"tier": v["tier"], "channel": v["channel"], "release": v["release"]}, v) for v in versions["tables"]]
+        intervals = {tier: {ch: {"from": iv["from"], "table": [ids[t] if t >= 0 else -1 for t in iv["table"]]}
+                            for ch, iv in chans.items()} for tier, chans in versions["index"].items()}
+    decoded = [(label, v["fuel_rate"], decode_price_table(v["table"])) for label, v in zip(labels, encoded)]
+    n_zones = max([max(cols["zones"], default=0) for *_, cols in decoded] + [8]) + 1
+    n = sum(len(cols["w"]) for *_, cols in decoded)
+    arrays = {
+        "weight": np.zeros(n),
+        "price": np.zeros((n, n_zones)),
+        "service": np.full(n, NO_SERVICE, dtype=np.uint8),
+        "table_id": np.zeros(n, dtype=np.uint16),
+    }
+    tables, offset = [], 0
+    for i, (label, fuel_rate, cols) in enumerate(decoded):
+        rows = slice(offset, offset + len(cols["w"]))
+        arrays["weight"][rows] = cols["w"]
+        arrays["table_id"][rows] = i
+        for z, p in cols["zones"].items():
+            arrays["price"][rows, z] = p
+        entry = dict(label, offset=offset, rows=len(cols["w"]), fuel_rate=fuel_rate, zones=sorted(cols["zones"]))
+        if cols["svc"] is not None:
+            arrays["service"][rows] = cols["svc"]
+            # XLmiles 行按 (服务, 重量) 排序, 每个服务是表内连续的 [起, 止) 行
+            entry["services"] = {}
+            for code, name in enumerate(XL_SERVICES):
+                idx = np.flatnonzero(cols["svc"] == code)
+                if len(idx): entry["services"][name] = [int(idx[0]), int(idx[-1]) + 1]
+        tables.append(entry)
+        offset = rows.stop
+    index = {"version": RATE_STORE_VERSION, "zones": n_zones, "services": list(XL_SERVICES),
+             "no_service": NO_SERVICE, "tables": tables,
+             "versions": {"releases": versions["releases"], "intervals": intervals} if versions else None}
+    return arrays, index
+
+def write_rate_store(final_data, out_dir=RATE_STORE_DIR):
+    # 数组文件名带内容哈希, 未变化的不重写; index.json 最后原子替换.
+    # 被替换的上一版 index 引用的文件保留一代: 已读到旧 index、尚未 np.load 的读者仍能打开, 再上一代的才清理
+    os.makedirs(out_dir, exist_ok=True)
+    index_path = os.path.join(out_dir, "index.json")
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            previous = set(json.load(f).get("arrays", {}).values())
+    except (OSError, ValueError):
+        previous = set()
+    arrays, index = rate_store_arrays(final_data)
+    index["arrays"] = {}
+    for name, a in arrays.items():
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(a), allow_pickle=False)
+        body = buf.getvalue()
+        fname = f"{name}.{hashlib.sha256(body).hexdigest()[:12]}.npy"
+        path = os.path.join(out_dir, fname)
+        if not os.path.exists(path): _write_bytes(path, body)
+        index["arrays"][name] = fname
+    _write_bytes(index_path, json.dumps(index, ensure_ascii=False, indent=1).encode("utf-8"))
+    keep = set(index["arrays"].values()) | previous
+    for fname in os.listdir(out_dir):
+        if _RATE_FILE_RE.match(fname) and fname not in keep:
+            os.remove(os.path.join(out_dir, fname))
+    print(f"  [OK] Rate store: {len(index['tables'])} tables, {len(arrays['weight'])} rows -> {out_dir}/")
+    return index
+
+# ==========================================
+# 7. 账单审计 (流式重算运费, 输出差异)
+# ==========================================
+
+# 标准列名 -> 账单 CSV 表头, 可用 --map 列名=表头 覆盖
+AUDIT_COLUMNS = {
+    "tracking": "tracking", "channel": "channel", "warehouse": "warehouse", "tier": "tier",
+    "zip": "zip", "L": "L", "W": "W", "H": "H", "weight": "weight",
+    "res": "res", "sig": "sig", "billed": "billed", "fuel_pct": "fuel_pct", "ship_date": "ship_date",
+}
+AUDIT_OPTIONAL = ("tracking", "tier", "res", "sig", "fuel_pct", "ship_date")
+AUDIT_OUTPUT = ["tracking", "channel", "warehouse", "tier", "zip", "zone", "billable",
+                "expected", "billed", "diff", "status"]
+
+_TRUTHY = {"1", "1.0", "true", "y", "yes", "res", "residential"}
+
+def _map_unique(col, fn, na):
+    # 只对去重后的值做字符串处理 (仓库/渠道/等级/邮编大量重复), 再按编码展开
+    import pandas as pd
+    codes, uniques = pd.factorize(col)
+    mapped = np.array([fn(str(u)) for u in uniques] + [na], dtype=object)
+    return mapped[codes]
+
+def _norm_zip(s):
+    # 兼容 CSV 中被导出为数字的邮编/仓库号 ("8691.0" -> "08691") 以及 ZIP+4 ("90210-1234" -> "90210")
+    return s.strip().split(".")[0].split("-")[0].zfill(5)
+
+def shipment_columns(chunk):
+    # CSV 块 (已按标准列名重命名) -> quote_batch 的列; 审计与比价共用
+    n = len(chunk)
+    return {
+        "warehouse": _map_unique(chunk["warehouse"], _norm_zip, "").astype(str)
+                     if "warehouse" in chunk else np.full(n, ""),
+        "tier": _map_unique(chunk["tier"], str.strip, "T3").astype(str) if "tier" in chunk else np.full(n, "T3"),
+        "zip": _map_unique(chunk["zip"], _norm_zip, "").astype(str),
+        "L": chunk["L"].to_numpy(dtype=np.float64), "W": chunk["W"].to_numpy(dtype=np.float64),
+        "H": chunk["H"].to_numpy(dtype=np.float64), "weight": chunk["weight"].to_numpy(dtype=np.float64),
+        "res": _map_unique(chunk["res"], lambda s: s.strip().lower() in _TRUTHY, True).astype(bool)
+               if "res" in chunk else np.ones(n, dtype=bool),
+        "sig": _map_unique(chunk["sig"], lambda s: s.strip().lower() in _TRUTHY, False).astype(bool)
+               if "sig" in chunk else np.zeros(n, dtype=bool),
+    }
+
+def audit_chunk(engine, chunk, fuel_pct, tolerance):
+    import pandas as pd
+    n = len(chunk)
+    ship = shipment_columns(chunk)
+    if "fuel_pct" in chunk:
+        fuel_pct = chunk["fuel_pct"].fillna(fuel_pct).to_numpy(dtype=np.float64)
+    channel = _map_unique(chunk["channel"], str.strip, "").astype(str)
+    billed = chunk["billed"]
+    if billed.dtype.kind not in "if":
+        billed = billed.astype(str).str.replace("$", "", regex=False).str.replace(",", "", regex=False).str.strip()
+    billed = pd.to_numeric(billed, errors="coerce").to_numpy(dtype=np.float64)
+
+    expected = np.full(n, np.nan)
+    zone = np.zeros(n, dtype=np.int64)
+    billable = np.full(n, np.nan)
+    # 有发货日期时按当日适用的价格发布分组 (无法解析的日期用当前价格), 组内同一渠道的行一起重算
+    groups = [(engine, np.arange(n))]
+    if "ship_date" in chunk and engine.releases:
+        groups = engine.split_by_date(pd.to_datetime(chunk["ship_date"], errors="coerce").to_numpy(dtype="datetime64[D]"))
+    for dated, group in groups:
+        for ch in np.unique(channel[group]):
+            if ch not in CHANNEL_CONFIG: continue
+            rows = group[channel[group] == ch]
+            sub = {k: v[rows] for k, v in ship.items()}
+            fuel = fuel_pct[rows] if np.ndim(fuel_pct) else fuel_pct
+            r = dated.quote_batch(sub, fuel_pct=fuel, channels=[ch])[ch]
+            expected[rows] = r["total"]
+            zone[rows] = r["zone"]
+            billable[rows] = r["billable"]
+
+    expected = np.round(expected, 2)
+    diff = np.round(billed - expected, 2)
+    status = np.select(
+        [~np.isin(channel, list(CHANNEL_CONFIG)), np.isnan(expected), np.isnan(billed),
+         diff > tolerance, diff < -tolerance],
+        ["unknown_channel", "unrated", "unbilled", "overcharge", "undercharge"], default="ok")
+    mask = status != "ok"
+    out = pd.DataFrame({
+        "tracking": chunk["tracking"].to_numpy() if "tracking" in chunk else chunk.index.to_numpy(),
+        "channel": channel, "warehouse": ship["warehouse"], "tier": ship["tier"], "zip": ship["zip"],
+        "zone": zone, "billable": billable, "expected": expected, "billed": billed, "diff": diff, "status": status,
+    })[mask]
+    return out[AUDIT_OUTPUT]
+
+def _resolve_columns(path, columns, optional, column_map, kind):
+    # 标准列名 -> CSV 中实际存在的表头; 缺少必需列时报错
+    import pandas as pd
+    cols = dict(columns)
+    cols.update(column_map or {})
+    header = pd.read_csv(path, nrows=0).columns
+    present = {k: v for k, v in cols.items() if v in header}
+    missing = [k for k in cols if k not in present and k not in optional]
+    if missing:
+        raise ValueError(f"{kind} is missing columns: {', '.join(cols[k] for k in missing)}")
+    return present
+
+def run_audit(engine, invoice_path, out_path, chunk_size=100000, tolerance=0.01, fuel_pct=None, column_map=None):
+    # 分块读取账单, 逐块重算并追加写出差异; 内存只与 chunk_size 有关
+    import pandas as pd
+    present = _resolve_columns(invoice_path, AUDIT_COLUMNS, AUDIT_OPTIONAL, column_map, "Invoice")
+    fuel_pct = engine.default_fuel_pct() if fuel_pct is None else fuel_pct
+
+    total = flagged = 0
+    t0 = time.perf_counter()
+    tmp = f"{out_path}.tmp"
+    reader = pd.read_csv(invoice_path, usecols=list(present.values()), chunksize=chunk_size,
+                         dtype={present["zip"]: str, present["warehouse"]: str})
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(AUDIT_OUTPUT) + "\n")
+        for chunk in reader:
+            chunk = chunk.rename(columns={v: k for k, v in present.items()})
+            out = audit_chunk(engine, chunk, fuel_pct, tolerance)
+            out.to_csv(f, header=False, index=False)
+            f.flush()
+            total += len(chunk)
+            flagged += len(out)
+            rate = total / max(time.perf_counter() - t0, 1e-9)
+            print(f"  [Audit] {total} rows, {flagged} discrepancies, {rate:,.0f} rows/s")
+    os.replace(tmp, out_path)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Audit done: {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s), "
+          f"{flagged} discrepancies -> {out_path}")
+    return {"rows": total, "discrepancies": flagged, "seconds": elapsed}
+
+
+# ==========================================
+# 8. 多仓比价 (订单文件流式比价, 每票取最便宜的仓库+渠道)
+# ==========================================
+
+SHOP_COLUMNS = {k: AUDIT_COLUMNS[k] for k in ("tracking", "tier", "zip", "L", "W", "H", "weight", "res", "sig", "fuel_pct")}
+SHOP_OPTIONAL = ("tracking", "tier", "res", "sig", "fuel_pct")
+SHOP_RANK_FIELDS = ("warehouse", "channel", "zone", "billable", "total")
+
+def shop_output_columns(top):
+    return ["tracking", "tier", "zip"] + [f"{f}_{k}" for k in range(1, top + 1) for f in SHOP_RANK_FIELDS]
+
+def shop_chunk(engine, chunk, fuel_pct, top, warehouses=None):
+    import pandas as pd
+    ship = shipment_columns(chunk)
+    if "fuel_pct" in chunk:
+        fuel_pct = chunk["fuel_pct"].fillna(fuel_pct).to_numpy(dtype=np.float64)
+    r = engine.rate_shop_batch(ship, fuel_pct=fuel_pct, warehouses=warehouses, top=top)
+    valid = ~np.isnan(r["total"])
+    out = {
+        "tracking": chunk["tracking"].to_numpy() if "tracking" in chunk else chunk.index.to_numpy(),
+        "tier": ship["tier"], "zip": ship["zip"],
+    }
+    for k in range(top):
+        out[f"warehouse_{k + 1}"] = r["warehouse"][:, k]
+        out[f"channel_{k + 1}"] = r["channel"][:, k]
+        # 无可用组合的名次留空
+        out[f"zone_{k + 1}"] = np.where(valid[:, k], r["zone"][:, k], None)
+        out[f"billable_{k + 1}"] = np.where(valid[:, k], r["billable"][:, k], np.nan)
+        out[f"total_{k + 1}"] = np.round(r["total"][:, k], 2)
+    return pd.DataFrame(out)[shop_output_columns(top)]
+
+def run_shop(engine, orders_path, out_path, chunk_size=100000, top=3, fuel_pct=None, column_map=None, warehouses=None):
+    # 分块读取订单, 逐块比价并追加写出; 内存只与 chunk_size × top 有关
+    import pandas as pd
+    present = _resolve_columns(orders_path, SHOP_COLUMNS, SHOP_OPTIONAL, column_map, "Order file")
+    fuel_pct = engine.default_fuel_pct() if fuel_pct is None else fuel_pct
+
+    total = unrated = 0
+    t0 = time.perf_counter()
+    tmp = f"{out_path}.tmp"
+    reader = pd.read_csv(orders_path, usecols=list(present.values()), chunksize=chunk_size,
+                         dtype={present["zip"]: str})
+    with open(tmp, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(shop_output_columns(top)) + "\n")
+        for chunk in reader:
+            chunk = chunk.rename(columns={v: k for k, v in present.items()})
+            out = shop_chunk(engine, chunk, fuel_pct, top, warehouses)
+            out.to_csv(f, header=False, index=False)
+            f.flush()
+            total += len(chunk)
+            unrated += int(out["channel_1"].isna().sum())
+            rate = total / max(time.perf_counter() - t0, 1e-9)
+            print(f"  [Shop] {total} rows, {unrated} without any option, {rate:,.0f} rows/s")
+    os.replace(tmp, out_path)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Rate shopping done: {total} rows in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s), "
+          f"{unrated} without any option -> {out_path}")
+    return {"rows": total, "unrated": unrated, "seconds": elapsed}
+
+# ==========================================
+# 9. 本地报价服务 (常驻内存, 数据包更新后热加载)
+# ==========================================
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+
+def _req_number(req, key, default=0):
+    # 请求中的数值字段: 缺省/空取 default; 非数值或 inf/nan 一律 ValueError (HTTP 400), 不让引擎里溢出变成 500
+    v = req.get(key)
+    if v is None or v == "": return default
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {key}: {v!r}")
+    if not math.isfinite(x): raise ValueError(f"Invalid {key}: {v!r}")
+    return x
+
+def _req_tier(engine, req):
+    tier = str(req.get("tier", "T3"))
+    if tier not in engine.tables: raise ValueError(f"Unknown tier: {tier}")
+    return tier
+
+class QuoteService:
+    """持有当前报价引擎; 后台线程轮询数据包, 有新版本时整体替换引擎"""
+
+    def __init__(self, bundle_path, poll_interval=1.0):
+        self.bundle_path = bundle_path
+        self.poll_interval = poll_interval
+        self.engine = None
+        self.loaded_at = None
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        from quote_engine import QuoteEngine, load_bundle
+        mtime = os.stat(self.bundle_path).st_mtime_ns
+        if mtime == self._mtime: return False
         try:
-            xl = pd.ExcelFile(path)
-            fuel_rate = extract_fuel_rate(xl)
-            
-            for ch_key, conf in CHANNEL_CONFIG.items():
-                sheet = find_sheet_name(xl, conf["keywords"], conf.get("exclude"))
-                if not sheet: continue
-                
-                df = pd.read_excel(xl, sheet_name=sheet, header=None)
-                prices = extract_prices(df, split_side=conf.get("sheet_side"), channel_name=ch_key)
-                
-                if prices:
-                    tier_data[ch_key] = {
-                        "prices": prices,
-                        "fuel_rate": fuel_rate if conf.get("fuel_calc") == "manual" else 0
-                    }
-                    print(f"  [OK] {ch_key}: {len(prices)} rows")
+            engine = QuoteEngine(load_bundle(self.bundle_path))
         except Exception as e:
-            print(f"  [Err] Failed to process {filename}: {e}")
-        
-        final_data["tiers"][tier] = tier_data
+            # 可能读到写了一半的文件, 保留旧引擎, 下次轮询再试
+            print(f"  [Warn] Bundle reload failed: {e}")
+            return False
+        # 引用替换是原子的, 进行中的请求继续用旧引擎算完
+        self.engine, self._mtime, self.loaded_at = engine, mtime, datetime.now().isoformat(timespec="seconds")
+        print(f"  [Serve] Bundle loaded: {self.bundle_path} ({self.loaded_at})")
+        return True
 
-    json_str = json.dumps(final_data, ensure_ascii=False).replace("NaN", "0")
-    html = HTML_TEMPLATE.replace('__JSON_DATA__', json_str)
+    def watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except FileNotFoundError:
+                pass
+
+    def quote(self, req, fuel_pct=None):
+        if "pieces" in req: return self.quote_pieces(req, fuel_pct)
+        engine = self.engine
+        for k in ("warehouse", "zip", "weight"):
+            if k not in req: raise ValueError(f"Missing field: {k}")
+        wh, zip_code = str(req["warehouse"]), str(req["zip"]).strip()
+        if wh not in engine.warehouses: raise ValueError(f"Unknown warehouse: {wh}")
+        L, W, H, Wt = (_req_number(req, k) for k in ("L", "W", "H", "weight"))
+        tier = _req_tier(engine, req)
+        fuel = _req_number(req, "fuel_pct", fuel_pct)
+        loc = engine.locate(wh, zip_code)
+        return {
+            "warehouse": wh, "tier": tier, "zip": zip_code,
+            "dim_weight": (L * W * H) / 222,
+            "location": {"gofo": loc["gofo"], "das": loc["das"]},
+            "compliance": compliance_summary(L, W, H, Wt),
+            "quotes": engine.quote(wh, tier, zip_code, L, W, H, Wt, res=req.get("res", True),
+                                   sig=req.get("sig", False), fuel_pct=fuel),
+        }
+
+    def quote_pieces(self, req, fuel_pct=None):
+        # 多件货: pieces = [{L, W, H, weight, qty}], 整票一个目的地, 每个渠道给出整票合计与逐行明细
+        engine = self.engine
+        for k in ("warehouse", "zip"):
+            if k not in req: raise ValueError(f"Missing field: {k}")
+        pieces = req["pieces"]
+        if not isinstance(pieces, list): raise ValueError("Invalid pieces: expected a list of objects")
+        if not pieces: raise ValueError("Empty pieces")
+        bad = next((pc for pc in pieces if not isinstance(pc, dict)), None)
+        if bad is not None: raise ValueError(f"Invalid piece: {bad!r}")
+        wh, zip_code = str(req["warehouse"]), str(req["zip"]).strip()
+        if wh not in engine.warehouses: raise ValueError(f"Unknown warehouse: {wh}")
+        cols = {k: [_req_number(pc, k) for pc in pieces] for k in ("L", "W", "H", "weight")}
+        cols["qty"] = [int(_req_number(pc, "qty") or 1) for pc in pieces]
+        if min(cols["qty"]) < 1: raise ValueError("Piece qty must be >= 1")
+        tier = _req_tier(engine, req)
+        fuel = _req_number(req, "fuel_pct", fuel_pct)
+        loc = engine.locate(wh, zip_code)
+        return {
+            "warehouse": wh, "tier": tier, "zip": zip_code, "pieces": sum(cols["qty"]),
+            "location": {"gofo": loc["gofo"], "das": loc["das"]},
+            "compliance": [compliance_summary(*dims) for dims in zip(cols["L"], cols["W"], cols["H"], cols["weight"])],
+            "quotes": engine.quote_shipment(wh, tier, zip_code, cols, res=req.get("res", True),
+                                            sig=req.get("sig", False), fuel_pct=fuel),
+        }
+
+    def shop(self, req):
+        # 多仓比价: 不需要 warehouse, 可用 warehouses 限定候选仓库
+        engine = self.engine
+        for k in ("zip", "weight"):
+            if k not in req: raise ValueError(f"Missing field: {k}")
+        warehouses = req.get("warehouses")
+        if warehouses is not None and not (isinstance(warehouses, list) and all(isinstance(wh, str) for wh in warehouses)):
+            raise ValueError("Invalid warehouses: expected a list of warehouse codes")
+        unknown = [wh for wh in warehouses or () if wh not in engine.warehouses]
+        if unknown: raise ValueError(f"Unknown warehouse: {', '.join(map(str, unknown))}")
+        zip_code = str(req["zip"]).strip()
+        L, W, H, Wt = (_req_number(req, k) for k in ("L", "W", "H", "weight"))
+        tier = _req_tier(engine, req)
+        return {
+            "tier": tier, "zip": zip_code,
+            "dim_weight": (L * W * H) / 222,
+            "compliance": compliance_summary(L, W, H, Wt),
+            "quotes": engine.rate_shop(tier, zip_code, L, W, H, Wt, res=req.get("res", True), sig=req.get("sig", False),
+                                       fuel_pct=_req_number(req, "fuel_pct", None), warehouses=warehouses),
+        }
+
+def compliance_summary(L, W, H, Wt):
+    # 与页面 checkCompliance 的提示一致
+    dims = sorted((L, W, H), reverse=True)
+    max_l, girth = dims[0], dims[0] + 2 * (dims[1] + dims[2])
+    msgs = []
+    if Wt > 150: msgs.append("超150lb (限XLmiles)")
+    if max_l > 108: msgs.append("长>108in (FedEx超长)")
+    return {"msgs": msgs, "status": {
+        "uniuni": "NO" if Wt > 20 or max_l > 20 else "OK",
+        "usps": "NO" if Wt > 70 or girth > 130 else "OK",
+        "xl": "NO" if Wt > 200 or max_l > 144 or girth > 225 else "OK",
+    }}
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    # keep-alive, 避免每次报价都重新建连; 关闭 Nagle, 否则响应头/体分两次发送会被延迟 ACK 卡住 ~40ms
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    service = None
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            svc = self.service
+            self._send(200, {"ok": True, "bundle": svc.bundle_path, "loaded_at": svc.loaded_at,
+                             "locate_cache": svc.engine.locate_cache_info()})
+        else:
+            self._send(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(req, dict): raise ValueError("Request body must be a JSON object")
+            if self.path == "/quote":
+                self._send(200, self.service.quote(req))
+            elif self.path == "/quote/batch":
+                fuel = _req_number(req, "fuel_pct", None)
+                shipments = req.get("shipments", [])
+                if not isinstance(shipments, list) or not all(isinstance(s, dict) for s in shipments):
+                    raise ValueError("shipments must be a list of JSON objects")
+                self._send(200, {"results": [self.service.quote(s, fuel) for s in shipments]})
+            elif self.path == "/shop":
+                self._send(200, self.service.shop(req))
+            else:
+                self._send(404, {"error": f"Not found: {self.path}"})
+        except (ValueError, TypeError, KeyError) as e:
+            self._send(400, {"error": str(e)})
+        except Exception as e:
+            # 兜底: 未预料的错误也回 JSON, 不让请求线程带着空响应退出
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(args):
+    bundle = args.bundle or os.path.join(OUTPUT_DIR, "index.html")
+    if not os.path.exists(bundle):
+        print(f"  [Info] {bundle} not found, building it first")
+        build_page(args)
+    service = QuoteService(bundle, poll_interval=args.poll)
+    threading.Thread(target=service.watch, daemon=True).start()
+    QuoteHandler.service = service
+    httpd = ThreadingHTTPServer((args.host, args.port), QuoteHandler)
+    httpd.daemon_threads = True
+    print(f"✅ Quote service on http://{args.host}:{args.port} (POST /quote, POST /quote/batch, POST /shop, GET /health)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+# ==========================================
+# 10. 价格卡导出 (等级 × 渠道 × 仓库, 进程池并行写出)
+# ==========================================
+EXPORT_DIR = "rate_cards"
+EXPORT_FORMATS = ("xlsx", "csv")
+EXPORT_MANIFEST = "index.csv"  # 导出目录下的清单: 每张价格卡一行
+EXPORT_INFLIGHT = 4  # 每个进程在途的价格卡数; 卡按需生成, 内存不随导出总数增长
+
+def rate_card_jobs(engine, out_dir, fmt, tiers=None, channels=None, warehouses=None, res=True, sig=False, fuel_pct=None):
+    # 逐张生成 (路径, 说明, 价格卡); 仓库按渠道的 allow_wh 过滤
+    for tier in sorted(engine.tables):
+        if tiers and tier not in tiers: continue
+        for ch, conf in engine.channels.items():
+            if channels and ch not in channels: continue
+            for wh in engine.warehouses:
+                if wh not in conf["allow_wh"] or (warehouses and wh not in warehouses): continue
+                card = engine.rate_card(tier, ch, wh, res=res, sig=sig, fuel_pct=fuel_pct)
+                if card is None: continue
+                meta = {
+                    "tier": tier, "channel": ch, "warehouse": wh, "warehouse_name": engine.warehouses[wh]["name"],
+                    "fuel_mode": conf["fuel_mode"], "fuel_pct": fuel_pct,
+                    "res_fee": conf["fees"]["res"] if res and conf["fees"]["res"] > 0 else 0,
+                    "sig_fee": conf["fees"]["sig"] if sig and conf["fees"]["sig"] > 0 else 0,
+                }
+                stem = re.sub(r'[^\w-]', '-', f"{tier}_{ch}_{wh}")
+                yield os.path.join(out_dir, f"{stem}.{fmt}"), meta, card
+
+def _card_rows(card):
+    # 表头 + 逐个计费重一行; 价格保留两位, 无价留空
+    svc = card["service"] is not None
+    yield (["service"] if svc else []) + ["weight"] + [f"Z{z}" for z in card["zones"]]
+    total = np.round(card["total"], 2)
+    for i, w in enumerate(card["weights"]):
+        prices = np.where(np.isnan(total[i]), None, total[i]).tolist()
+        yield ([card["service"][i]] if svc else []) + [int(w) if w.is_integer() else w] + prices
+
+def _fuel_note(meta):
+    if meta["fuel_mode"] == "none": return "不收燃油费"
+    if meta["fuel_mode"] == "included": return "燃油费已含在基础价中"
+    rate = meta["fuel_pct"] * (0.85 if meta["fuel_mode"] == "discount_85" else 1)
+    return f"燃油 {rate:.2f}%" + (" (85折)" if meta["fuel_mode"] == "discount_85" else "")
+
+def write_rate_card(path, meta, card, fmt):
+    # 在子进程中执行: 逐行写出 (xlsx 用 openpyxl 只写模式), 先写临时文件再原子改名
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "csv":
+            # utf-8-sig: Excel 直接打开时中文不乱码
+            with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+                csv.writer(f).writerows(_card_rows(card))
+        else:
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet(meta["tier"])
+            ws.append([f"{meta['channel']} · {meta['tier']} · {meta['warehouse_name']} ({meta['warehouse']})"])
+            ws.append([f"{_fuel_note(meta)}; 住宅附加费 ${meta['res_fee']}; 签名费 ${meta['sig_fee']}; "
+                       "价格已含以上各项, 单位: 磅 / 美元"])
+            ws.append([])
+            for row in _card_rows(card):
+                ws.append(row)
+            wb.save(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    return dict(meta, file=os.path.basename(path), weights=len(card["weights"]),
+                zones=" ".join(map(str, card["zones"])))
+
+def run_export(engine, out_dir=EXPORT_DIR, fmt="xlsx", jobs=1, tiers=None, channels=None, warehouses=None,
+               res=True, sig=False, fuel_pct=None):
+    # 主进程按需生成价格卡, 子进程写文件; 在途任务数有上限, 内存与导出总数无关
+    os.makedirs(out_dir, exist_ok=True)
+    fuel_pct = engine.default_fuel_pct() if fuel_pct is None else fuel_pct
+    t0 = time.perf_counter()
+    cards = rate_card_jobs(engine, out_dir, fmt, tiers, channels, warehouses, res, sig, fuel_pct)
+    manifest = []
+    if jobs <= 1:
+        manifest = [write_rate_card(path, meta, card, fmt) for path, meta, card in cards]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            running = set()
+            for path, meta, card in cards:
+                if len(running) >= jobs * EXPORT_INFLIGHT:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    manifest += [f.result() for f in done]
+                running.add(pool.submit(write_rate_card, path, meta, card, fmt))
+            manifest += [f.result() for f in wait(running)[0]]
+    manifest.sort(key=lambda m: m["file"])
+
+    columns = ["file", "tier", "channel", "warehouse", "warehouse_name", "fuel_mode", "fuel_pct",
+               "res_fee", "sig_fee", "weights", "zones"]
+    with open(os.path.join(out_dir, EXPORT_MANIFEST), "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=columns)
+        w.writeheader()
+        w.writerows(manifest)
+    elapsed = time.perf_counter() - t0
+    print(f"✅ Exported {len(manifest)} rate cards ({fmt}) in {elapsed:.2f}s -> {out_dir}/ (see {EXPORT_MANIFEST})")
+    return {"files": len(manifest), "seconds": elapsed}
+
+# ==========================================
+# 11. 命令行入口
+# ==========================================
+
+def _iso_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a date as YYYY-MM-DD, got {value!r}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="生成业务员报价助手页面")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="并行进程数 (1 = 串行, 默认 CPU 核数)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"忽略 {CACHE_DIR}/ 中的增量缓存, 全部重新解析")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"用 cProfile 剖析各解析阶段, 最慢阶段写入 {OUTPUT_DIR}/{PROFILE_FILE}")
+    parser.add_argument("--watch", action="store_true",
+                        help=f"构建后持续监视 {DATA_DIR}/, 文件变化时只重建对应等级/DAS 并重新发布")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="用 tracemalloc 记录各阶段 Python 内存峰值 (解析会变慢)")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("build", help="生成 public/index.html 与数据分片 (默认)")
+    p.add_argument("--inline", action="store_true", help="全部数据内联进 index.html (可直接双击打开, 不拆分片)")
+
+    p = sub.add_parser("audit", help="按 T0-T3 价格表流式审计承运商账单 CSV")
+    p.add_argument("invoices", help="账单 CSV 路径")
+    p.add_argument("--out", default="audit_discrepancies.csv", help="差异输出 CSV")
+    p.add_argument("--chunk-size", type=int, default=100000, help="每块读取行数")
+    p.add_argument("--tolerance", type=float, default=0.01, help="允许误差 ($)")
+    p.add_argument("--fuel", type=float, default=None, help="燃油费率 %% (账单无 fuel_pct 列时使用)")
+    p.add_argument("--bundle", default=None,
+                   help="从已生成的 index.html 读取价格表, 不重新构建 (页面不含带日期的发布, ship_date 列不起作用)")
+    p.add_argument("--map", action="append", default=[], metavar="列名=表头",
+                   help=f"账单表头映射, 列名: {', '.join(AUDIT_COLUMNS)}")
+
+    p = sub.add_parser("shop", help="订单 CSV 多仓比价: 每票列出总费用最低的 (仓库, 渠道)")
+    p.add_argument("orders", help="订单 CSV 路径 (列: zip, L, W, H, weight; 可选 tracking, tier, res, sig, fuel_pct)")
+    p.add_argument("--out", default="shop_results.csv", help="比价结果 CSV")
+    p.add_argument("--top", type=int, default=3, help="每票输出前几名")
+    p.add_argument("--warehouse", action="append", default=None, help="只在这些仓库中比价 (可重复)")
+    p.add_argument("--chunk-size", type=int, default=100000, help="每块读取行数")
+    p.add_argument("--fuel", type=float, default=None, help="燃油费率 %% (订单无 fuel_pct 列时使用)")
+    p.add_argument("--bundle", default=None, help="从已生成的 index.html 读取价格表, 不重新构建")
+    p.add_argument("--map", action="append", default=[], metavar="列名=表头",
+                   help=f"订单表头映射, 列名: {', '.join(SHOP_COLUMNS)}")
+
+    p = sub.add_parser("export", help="导出客户价格卡: 每个 等级 × 渠道 × 仓库 一个文件 (计费重 × 分区)")
+    p.add_argument("--out", default=EXPORT_DIR, help="输出目录")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="xlsx", help="文件格式")
+    p.add_argument("--tier", action="append", default=None, help="只导出这些等级 (可重复)")
+    p.add_argument("--channel", action="append", default=None, help="只导出这些渠道 (可重复)")
+    p.add_argument("--warehouse", action="append", default=None, help="只导出这些仓库 (可重复)")
+    p.add_argument("--fuel", type=float, default=None, help="燃油费率 %% (默认同页面初始值)")
+    p.add_argument("--commercial", action="store_true", help="按商业地址报价 (不含住宅附加费)")
+    p.add_argument("--sig", action="store_true", help="含签名费")
+    p.add_argument("--as-of", default=None, type=_iso_date, metavar="YYYY-MM-DD", help="按该日适用的带日期发布导出 (不可与 --bundle 同用)")
+    p.add_argument("--bundle", default=None, help="从已生成的 index.html 读取价格表, 不重新构建")
+
+    p = sub.add_parser("serve", help="启动本地 HTTP 报价服务")
+    p.add_argument("--host", default=SERVE_HOST)
+    p.add_argument("--port", type=int, default=SERVE_PORT)
+    p.add_argument("--bundle", default=None, help="数据包页面路径 (默认 public/index.html)")
+    p.add_argument("--poll", type=float, default=1.0, help="检查数据包更新的间隔 (秒)")
+    return parser.parse_args(argv)
+
+def load_engine(args):
+    from quote_engine import QuoteEngine, load_bundle
+    if getattr(args, "bundle", None):
+        return QuoteEngine(load_bundle(args.bundle))
+    return QuoteEngine(build_final_data(jobs=args.jobs, use_cache=not args.no_cache))
+
+def write_page(final_data, inline=False, report=None):
+    report = report or BuildReport()
+    index_path = os.path.join(OUTPUT_DIR, "index.html")
+    with report.phase("write"):
+        shell, shards = split_bundle(final_data)
+        if inline:
+            shell["inline"] = shards
+        else:
+            shell["shards"] = write_shards(shards)
+        assets = write_assets()
+
+        # 分片与资源先就位, 外壳页流式写出后原子替换: 任何时刻读到的页面都完整且分片齐全
+        write_html(index_path, shell, assets)
+        if not inline: prune_shards(shell["shards"])
+        prune_assets(assets)
+        # 最后更新 Service Worker, 清单里的文件此时都已就位
+        precache, runtime = write_service_worker(assets.values(), shell.get("shards", {}).values())
+    with report.phase("rate_store"):
+        rate_index = write_rate_store(final_data)
     
-    with open(os.path.join(OUTPUT_DIR, "index.html"), "w", encoding="utf-8") as f:
-        f.write(html)
+    report.output = {"index_html": os.path.getsize(index_path),
+                     "shards": {name: os.path.getsize(os.path.join(OUTPUT_DIR, url))
+                                for name, url in shell.get("shards", {}).items()},
+                     "assets": {name: os.path.getsize(os.path.join(OUTPUT_DIR, url)) for name, url in assets.items()},
+                     "precache_files": len(precache), "runtime_cached_files": len(runtime),
+                     "rate_store": {name: os.path.getsize(os.path.join(RATE_STORE_DIR, fname))
+                                    for name, fname in rate_index["arrays"].items()}}
+    print(f"  [Report] {report.write(OUTPUT_DIR)}")
+
+def build_page(args):
+    if not os.path.exists(OUTPUT_DIR): os.makedirs(OUTPUT_DIR)
     
+    print(f"--- Starting Generation (V2026.10 Final, jobs={args.jobs}) ---")
+    if args.watch:
+        return watch(args)
+    
+    report = BuildReport(profile=args.profile, trace_memory=args.trace_memory)
+    final_data = build_final_data(jobs=args.jobs, use_cache=not args.no_cache, report=report)
+    write_page(final_data, getattr(args, "inline", False), report)
     print("✅ index.html generated successfully.")
+    if not getattr(args, "inline", False):
+        print("  [Info] Data is split into shards: open the page over http, or rebuild with `build --inline` to open it from disk")
+
+def _input_stamps(files):
+    # 轮询只 stat 已知的输入文件: (mtime_ns, size), 文件不存在为 None
+    stamps = {}
+    for f in files:
+        try:
+            st = os.stat(os.path.join(DATA_DIR, f))
+            stamps[f] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[f] = None
+    return stamps
+
+def _stage_inputs(stages):
+    # 输入文件 -> 依赖它的阶段
+    by_file = {}
+    for name, st in stages.items():
+        for f in st["inputs"]: by_file.setdefault(f, []).append(name)
+    return by_file
+
+def _release_layout():
+    # 发布目录及其中的等级工作簿; 变化时监视模式需增删 tier:T?@<发布> 阶段
+    return tuple((r["id"], tuple(sorted(r["files"].items()))) for r in discover_releases(warn=False))
+
+def watch(args):
+    # 常驻内存保留各阶段结果与 final_data; 输入变化后只重跑对应阶段并局部重编码
+    use_cache = not args.no_cache
+    inline = getattr(args, "inline", False)
+    layout = _release_layout()
+    stages = build_stages(use_cache)
+    by_file = _stage_inputs(stages)
+    stamps = _input_stamps(by_file)
+
+    report = BuildReport(profile=args.profile, trace_memory=args.trace_memory)
+    with report.phase("stages"):
+        results = run_stages(stages, jobs=args.jobs, use_cache=use_cache, report=report)
+    with report.phase("encode"):
+        final_data = encode_final_data(results)
+    write_page(final_data, inline, report)
+    print(f"[Watch] Watching {len(by_file)} files in {DATA_DIR}/, Ctrl+C to stop")
+
+    try:
+        while True:
+            time.sleep(WATCH_POLL)
+            current, latest_layout = _input_stamps(by_file), _release_layout()
+            if current == stamps and latest_layout == layout: continue
+            # 去抖: Excel/同步盘保存 (或复制发布目录) 时会连续写多次, 等文件静止 WATCH_DEBOUNCE 秒再解析
+            settled = time.monotonic()
+            while time.monotonic() - settled < WATCH_DEBOUNCE:
+                time.sleep(WATCH_POLL)
+                latest = (_input_stamps(by_file), _release_layout())
+                if latest != (current, latest_layout): (current, latest_layout), settled = latest, time.monotonic()
+
+            # 新增/删除了发布目录 (或发布目录中增删了工作簿): 重建阶段表, 新阶段随后解析, 删掉的阶段丢弃结果
+            added, removed = [], []
+            if latest_layout != layout:
+                old, layout = stages, latest_layout
+                stages = build_stages(use_cache)
+                by_file = _stage_inputs(stages)
+                added = [n for n in stages if n not in old]
+                removed = [n for n in old if n not in stages]
+                for n in removed: results.pop(n, None)
+                current = _input_stamps(by_file)
+            changed = [f for f in by_file if current[f] != stamps.get(f)]
+            stamps = current
+            names = [n for n in stages if n in added or any(n in by_file[f] for f in changed)]
+            print("[Watch] " + "; ".join(
+                part for part in (f"{', '.join(changed)} changed" if changed else "",
+                                  f"added {', '.join(added)}" if added else "",
+                                  f"removed {', '.join(removed)}" if removed else "") if part)
+                  + (f", rebuilding {', '.join(names)}" if names else ""))
+
+            t0 = time.perf_counter()
+            report = BuildReport(profile=args.profile, trace_memory=args.trace_memory)
+            fresh = {}
+            if names:
+                with report.phase("stages"):
+                    fresh = run_stages({n: stages[n] for n in names}, jobs=args.jobs, use_cache=use_cache, report=report)
+            # 解析失败 (如文件仍在写入) 时保留上一版数据, 文件再次变化时会重试
+            ok = [n for n in names if not fresh[n].get("errors")]
+            for n in names:
+                if n not in ok: print(f"  [Warn] {n} failed, keeping previous data")
+            if not ok and not removed: continue
+            results.update((n, fresh[n]) for n in ok)
+            with report.phase("encode"):
+                patch_final_data(final_data, results, ok + removed)
+            write_page(final_data, inline, report)
+            print(f"[Watch] Republished in {time.perf_counter() - t0:.2f}s")
+    except KeyboardInterrupt:
+        print("[Watch] Stopped")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "audit":
+        column_map = dict(m.split("=", 1) for m in args.map)
+        run_audit(load_engine(args), args.invoices, args.out, chunk_size=args.chunk_size,
+                  tolerance=args.tolerance, fuel_pct=args.fuel, column_map=column_map)
+    elif args.command == "shop":
+        column_map = dict(m.split("=", 1) for m in args.map)
+        run_shop(load_engine(args), args.orders, args.out, chunk_size=args.chunk_size, top=args.top,
+                 fuel_pct=args.fuel, column_map=column_map, warehouses=args.warehouse)
+    elif args.command == "export":
+        if args.as_of and args.bundle: raise SystemExit("--as-of needs the dated releases in data/, drop --bundle")
+        engine = load_engine(args)
+        if args.as_of: engine = engine.as_of(args.as_of)
+        run_export(engine, args.out, fmt=args.format, jobs=args.jobs, tiers=args.tier, channels=args.channel,
+                   warehouses=args.warehouse, res=not args.commercial, sig=args.sig, fuel_pct=args.fuel)
+    elif args.command == "serve":
+        serve(args)
+    else:
+        build_page(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,712 @@
+import json
+import os
+import re
+import copy
+import math
+import bisect
+import base64
+import functools
+import numpy as np
+
+# ==========================================
+# Python 报价引擎: 与页面 JS (calcZone / checkCompliance / getXLService / 燃油 / 附加费) 逐项一致
+# 输入为 generate.py 产出的数据包 (final_data), 批量接口全部用 NumPy 列运算
+# ==========================================
+
+XL_SERVICES = ("AH", "OS", "OM")
+DIM_DIVISOR = 222
+DEFAULT_FUEL_PCT = 16.0
+ZONE_SOURCES = ("gofo", "xlmiles", "general")
+LOCATE_CACHE_SIZE = 65536
+
+SHIPMENT_COLUMNS = ("warehouse", "tier", "zip", "L", "W", "H", "weight", "res", "sig")
+
+def _decode_array(enc):
+    raw = base64.b64decode(enc["b"])
+    if enc["t"] == "u1": return np.frombuffer(raw, dtype=np.uint8)
+    if enc["t"] == "u2": return np.frombuffer(raw, dtype='<u2')
+    if enc["t"] == "i4": return np.frombuffer(raw, dtype='<i4').astype(np.int64)
+    if enc["t"] == "f4": return np.frombuffer(raw, dtype='<f4').astype(np.float64)
+    if enc["t"] == "c4": return np.frombuffer(raw, dtype='<i4') / 100
+    return np.frombuffer(raw, dtype='<f8').astype(np.float64)
+
+def decode_price_table(table):
+    return {
+        "w": _decode_array(table["w"]),
+        "zones": {int(z): _decode_array(p) for z, p in table["zones"].items()},
+        "svc": _decode_array(table["svc"]) if "svc" in table else None,
+    }
+
+def decode_zip_set(enc):
+    # 区间或位图编码 -> 长 100000 的布尔表, 下标即 5 位邮编
+    if "bitmap" in enc:
+        return np.unpackbits(_decode_array(enc["bitmap"]), bitorder="little")[:100000].astype(bool)
+    r = _decode_array(enc["ranges"]).reshape(-1, 2)
+    edges = np.zeros(100001, dtype=np.int64)
+    np.add.at(edges, r[:, 0], 1)
+    np.add.at(edges, r[:, 1], -1)
+    return np.cumsum(edges[:100000]) > 0
+
+def decode_zip_db(enc):
+    # 字典编码的 GOFO 邮编库 -> 有序邮编数组 + 各列编码与字符串表
+    if not enc:
+        return {"zip": np.zeros(0, dtype=np.int64), "city": [], "state": [], "region": [],
+                "cities": [], "states": [], "states_cn": [], "regions": []}
+    db = {k: enc[k] for k in ("cities", "states", "states_cn", "regions")}
+    db["zip"] = _decode_array(enc["zip"])
+    for field in ("city", "state", "region"):
+        db[field] = _decode_array(enc[field]).tolist()
+    return db
+
+def load_bundle(path):
+    # 从生成的页面中取回数据包 (<script type="application/json" id="rate-data">)
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    m = re.search(r'<script type="application/json" id="rate-data">(.*?)</script>', html, re.S)
+    if not m: raise ValueError(f"No rate data found in {path}")
+    shell = json.loads(m.group(1).replace("<\\/", "</"))
+    if "inline" in shell:
+        return assemble_bundle(shell, shell["inline"])
+    if "shards" in shell:
+        base = os.path.dirname(os.path.abspath(path))
+        shards = {}
+        for name, url in shell["shards"].items():
+            with open(os.path.join(base, url), encoding="utf-8") as f:
+                shards[name] = json.load(f)
+        return assemble_bundle(shell, shards)
+    return shell
+
+def merge_zone_tables(parts):
+    # 各仓库的分区表分片合并回一份, 表下标按顺序平移
+    out = {"zip5_keys": None, "tables": [], "warehouses": {}}
+    for zt in parts:
+        base = len(out["tables"])
+        out["tables"].extend(zt["tables"])
+        out["zip5_keys"] = out["zip5_keys"] or zt.get("zip5_keys")
+        for wh, entry in zt["warehouses"].items():
+            out["warehouses"][wh] = {src: {k: i + base for k, i in t.items()} for src, t in entry.items()}
+    return out
+
+def assemble_bundle(shell, shards):
+    # 外壳 + 分片 -> 与 generate.build_final_data 相同结构的数据包
+    return {
+        "warehouses": shell["warehouses"],
+        "channels": shell["channels"],
+        "gofo_zips": shards.get("gofo_zips"),
+        "fedex_das": shards.get("fedex_das") or {"order": [], "sets": {}},
+        "zone_tables": merge_zone_tables(v for k, v in shards.items() if k.startswith("zones:")),
+        "tiers": {k.split(":", 1)[1]: v for k, v in shards.items() if k.startswith("tier:")},
+    }
+
+def to_days(dates):
+    # 日期 (date / "YYYY-MM-DD" / datetime64, 标量或数组) -> 1970-01-01 起的天数; NaT 为 int64 最小值, 早于任何发布
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+def interval_lists(index):
+    # rate_versions 区间索引 -> {(等级, 渠道): (断点天数列表, 表下标列表)}, 供 bisect 查询
+    return {(tier, ch): (to_days(v["from"]).tolist(), list(v["table"]))
+            for tier, chans in (index or {}).items() for ch, v in chans.items()}
+
+def table_as_of(intervals, key, day):
+    # 某日适用的表下标: 不晚于该日的最后一个断点 (二分, O(log n)); 无发布覆盖为 -1
+    if key not in intervals: return -1
+    starts, ids = intervals[key]
+    i = bisect.bisect_right(starts, day) - 1
+    return ids[i] if i >= 0 else -1
+
+def _js_parse_int(s):
+    # 与 JS parseInt 一致: 跳过前导空白, 支持符号与 0x 前缀, 无数字时为 NaN
+    m = re.match(r'\s*([+-]?)(?:0[xX]([0-9a-fA-F]+)|(\d+))', s)
+    if not m: return np.nan
+    v = int(m.group(2), 16) if m.group(2) else int(m.group(3))
+    return -v if m.group(1) == "-" else v
+
+def zip_strings(zips):
+    # 邮编统一为去空白的字符串; 数值型邮编补齐 5 位 (如 8691 -> "08691")
+    arr = np.asarray(zips)
+    if arr.dtype.kind in "iuf":
+        return np.char.zfill(arr.astype(np.int64).astype(str), 5)
+    return np.char.strip(arr.astype(str))
+
+def zip_prefix(zips, normalized=False):
+    # 3 位前缀 (parseInt(zip.substring(0,3))); 不足 3 位记 -1, 无法解析为 NaN
+    z = zips if normalized else zip_strings(zips)
+    out = np.full(len(z), np.nan)
+    lens = np.char.str_len(z)
+    ok = lens >= 3
+    head = z.astype("U3")
+    fast = ok & np.char.isdigit(head)
+    out[fast] = head[fast].astype(np.int64)
+    for i in np.flatnonzero(ok & ~fast):
+        out[i] = _js_parse_int(head[i])
+    out[~ok] = -1
+    return out
+
+def _zip_keys(zips, normalized=False):
+    # 5 位纯数字邮编 -> 整数键, 其余 -1 (不可能命中 GOFO 表)
+    z = zips if normalized else zip_strings(zips)
+    keys = np.full(len(z), -1, dtype=np.int64)
+    ok = (np.char.str_len(z) == 5) & np.char.isdigit(z)
+    keys[ok] = z[ok].astype(np.int64)
+    return keys
+
+def _as_column(shipments, name, n, default):
+    if name in shipments:
+        return np.asarray(shipments[name])
+    return np.full(n, default)
+
+def xl_service_codes(L, W, H, Wt):
+    # getXLService: 返回 XL_SERVICES 下标, -1 为超 XL 规格
+    dims = -np.sort(-np.stack([L, W, H]), axis=0)
+    max_l = dims[0]
+    girth = max_l + 2 * (dims[1] + dims[2])
+    return np.select(
+        [(max_l <= 96) & (girth <= 130) & (Wt <= 150),
+         (max_l <= 108) & (girth <= 165) & (Wt <= 150),
+         (max_l <= 144) & (girth <= 225) & (Wt <= 200)],
+        [0, 1, 2], default=-1)
+
+def compliance(L, W, H, Wt):
+    # checkCompliance: 各渠道是否超规 (True = NO)
+    dims = -np.sort(-np.stack([L, W, H]), axis=0)
+    max_l = dims[0]
+    girth = dims[0] + 2 * (dims[1] + dims[2])
+    return {
+        "uniuni": (Wt > 20) | (max_l > 20),
+        "usps": (Wt > 70) | (girth > 130),
+        "xl": (Wt > 200) | (max_l > 144) | (girth > 225),
+    }
+
+
+class QuoteEngine:
+    """由数据包构建的报价引擎; quote_batch 对整批包裹按渠道做向量化计价"""
+
+    def __init__(self, final_data):
+        self.data = final_data
+        self.channels = final_data["channels"]
+        self.warehouses = final_data["warehouses"]
+        self.tables = {
+            tier: {ch: self._price_matrix(decode_price_table(v["table"])) for ch, v in chans.items()}
+            for tier, chans in final_data["tiers"].items()
+        }
+        self._load_zone_tables(final_data.get("zone_tables"))
+        self._gofo = decode_zip_db(final_data.get("gofo_zips"))
+        # DAS: 每个 5 位邮编一个类别编号 (0 = 非偏远), 高优先级类别覆盖低优先级
+        das = final_data.get("fedex_das") or {"order": [], "sets": {}}
+        self.das_categories = [None] + list(das["order"])
+        self._das_code = np.zeros(100000, dtype=np.uint8)
+        for code in range(len(das["order"]), 0, -1):
+            self._das_code[decode_zip_set(das["sets"][das["order"][code - 1]])] = code
+        self._locate_cached = functools.lru_cache(maxsize=LOCATE_CACHE_SIZE)(self._locate)
+        # 带日期的价格发布 (generate.encode_rate_versions); 页面数据包不含, 此时 as_of 总是返回自身
+        versions = final_data.get("rate_versions") or {}
+        self.releases = versions.get("releases", [])
+        self._version_tables = versions.get("tables", [])
+        self._intervals = interval_lists(versions.get("index"))
+        self._as_of_engines = {}
+        self._version_matrices = {}
+
+    @staticmethod
+    def _price_matrix(cols):
+        # 分区价格拼成 (最大分区+1, n) 矩阵, 缺失分区为 0, 便于按行 gather
+        n = len(cols["w"])
+        max_zone = max(cols["zones"], default=0)
+        mat = np.zeros((max(max_zone, 8) + 1, n))
+        for z, p in cols["zones"].items():
+            mat[z] = p
+        ranges = None
+        if cols["svc"] is not None:
+            ranges = {}
+            for code in range(len(XL_SERVICES)):
+                idx = np.flatnonzero(cols["svc"] == code)
+                if len(idx): ranges[code] = (int(idx[0]), int(idx[-1]) + 1)
+        # 标量路径用的 Python 列表副本, bisect 比单元素 NumPy 调用快得多
+        return {"w": cols["w"], "mat": mat, "ranges": ranges, "w_list": cols["w"].tolist(), "rows": mat.tolist()}
+
+    def _load_zone_tables(self, zt):
+        # 每个分区来源: 前缀表 (仓库数+1, 1001), 末行给未知仓库 (一律 Zone 8); 有 5 位覆盖的仓库再展开成 100000 项整表
+        if zt is None: raise ValueError("Bundle has no zone_tables, rebuild it with generate.py")
+        self._wh_index = {wh: i for i, wh in enumerate(zt["warehouses"])}
+        n = len(self._wh_index)
+        keys = _decode_array(zt["zip5_keys"]) if zt.get("zip5_keys") else None
+        tables = [_decode_array(t) for t in zt["tables"]]
+        self._zone_prefix = {src: np.full((n + 1, 1001), 8, dtype=np.uint8) for src in ZONE_SOURCES}
+        self._zone_zip5 = {src: [None] * (n + 1) for src in ZONE_SOURCES}
+        dense = {}
+        for wh, i in self._wh_index.items():
+            for src, t in zt["warehouses"][wh].items():
+                self._zone_prefix[src][i] = tables[t["prefix"]]
+                if "zip5" in t and keys is not None:
+                    k = (t["prefix"], t["zip5"])
+                    if k not in dense:
+                        dense[k] = np.repeat(tables[t["prefix"]][:1000], 100)
+                        dense[k][keys] = tables[t["zip5"]]
+                    self._zone_zip5[src][i] = dense[k]
+
+    def as_of(self, ship_date):
+        # 按发货日期适用的价格表构成的引擎; 分区/邮编库/DAS 与本引擎共用. 没有发布覆盖的等级×渠道沿用当前价格表
+        day = int(to_days(ship_date))
+        key = tuple(table_as_of(self._intervals, k, day) for k in self._intervals)
+        if all(t < 0 for t in key): return self
+        engine = self._as_of_engines.get(key)
+        if engine is None:
+            engine = copy.copy(self)
+            engine.tables = {tier: dict(chans) for tier, chans in self.tables.items()}
+            tiers = {tier: dict(chans) for tier, chans in self.data["tiers"].items()}
+            for (tier, ch), t in zip(self._intervals, key):
+                if t < 0: continue
+                if t not in self._version_matrices:
+                    self._version_matrices[t] = self._price_matrix(decode_price_table(self._version_tables[t]["table"]))
+                engine.tables.setdefault(tier, {})[ch] = self._version_matrices[t]
+                tiers.setdefault(tier, {})[ch] = self._version_tables[t]
+            engine.data = dict(self.data, tiers=tiers)
+            self._as_of_engines[key] = engine
+        return engine
+
+    def split_by_date(self, ship_dates):
+        # 按发货日期分组: [(适用的引擎, 行下标)], 价格表组合相同的日期归为一组; 缺日期 (NaT) 的行用当前价格表
+        days = to_days(ship_dates)
+        uniq, inverse = np.unique(days, return_inverse=True)
+        groups = {}
+        for k, day in enumerate(uniq.tolist()):
+            engine = self.as_of(np.datetime64(day, "D")) if self._intervals else self
+            groups.setdefault(id(engine), (engine, []))[1].append(k)
+        inverse = inverse.reshape(-1)
+        return [(engine, np.flatnonzero(np.isin(inverse, ks))) for engine, ks in groups.values()]
+
+    def default_fuel_pct(self):
+        # 与页面初始化一致: 取 T3 各渠道 fuel_rate 最大值, 否则 16%
+        max_fuel = max([v.get("fuel_rate") or 0 for v in self.data["tiers"].get("T3", {}).values()], default=0)
+        return max_fuel * 100 if max_fuel > 0 else DEFAULT_FUEL_PCT
+
+    def warehouse_index(self, warehouses):
+        # 仓库 -> 分区表行号, 未知仓库落在末行
+        wh = np.asarray(warehouses).astype(str)
+        uniq, inv = np.unique(wh, return_inverse=True)
+        idx = np.array([self._wh_index.get(w, len(self._wh_index)) for w in uniq], dtype=np.int64)
+        return idx[inv.reshape(-1)]
+
+    def warehouse_zones(self, warehouse, zone_source):
+        # 从某仓库按该分区来源能算出的全部分区 (3 位前缀表 + 5 位整表), 升序
+        i = self._wh_index.get(str(warehouse), len(self._wh_index))
+        zones = self._zone_prefix[zone_source][i, :1000]
+        dense = self._zone_zip5[zone_source][i]
+        if dense is not None: zones = np.concatenate([zones, dense])
+        return np.unique(zones).tolist()
+
+    def rate_card(self, tier, channel, warehouse, res=True, sig=False, fuel_pct=None):
+        """某等级某渠道从某仓库发货的价格卡: 每个重量档 × 该仓库可达的分区.
+        附加费/燃油的计法与 quote_batch 相同, 分区无价同样回退 Zone 8 (XLmiles 回退 Zone 6).
+        返回 {weights, service, zones, base, total}, weights 为计费重 (XLmiles 为原档位, 其余为整磅),
+        base/total 为 (计费重, 分区) 矩阵, 无价为 NaN;
+        该等级无此渠道或渠道不发该仓库时返回 None"""
+        conf = self.channels.get(channel)
+        tbl = self.tables.get(tier, {}).get(channel)
+        if conf is None or tbl is None or str(warehouse) not in conf["allow_wh"]: return None
+        is_xl = "XLmiles" in channel
+        zones = self.warehouse_zones(warehouse, conf["zone_source"])
+        w = tbl["w"]
+        if is_xl:
+            weights, idx = w, np.arange(len(w))
+        else:
+            # 计费重向上取整到整磅, 按整磅列出 (盎司档位报价时用不到), 档位取法同 _lookup
+            weights = np.arange(1, np.floor(w[-1] + 0.001) + 1) if len(w) else w
+            idx = np.searchsorted(w, weights - 0.001, side="left")
+        mat = tbl["mat"][:, idx]
+        cols = mat[np.clip(zones, 0, mat.shape[0] - 1)]
+        base = np.where(cols != 0, cols, mat[6 if is_xl else 8]).T
+
+        # 累加顺序同 _price, 与逐票报价逐分相同
+        fees = conf["fees"]
+        surcharges = np.zeros(base.shape)
+        if fees["res"] > 0 and res: surcharges = surcharges + fees["res"]
+        if fees["sig"] > 0 and sig: surcharges = surcharges + fees["sig"]
+        if conf["fuel_mode"] not in ("none", "included"):
+            rate = np.float64(self.default_fuel_pct() if fuel_pct is None else fuel_pct) / 100
+            if conf["fuel_mode"] == "discount_85": rate = rate * 0.85
+            surcharges = surcharges + (base + surcharges) * rate
+        service = None
+        if tbl["ranges"] is not None:
+            service = [None] * len(tbl["w"])
+            for code, (lo, hi) in tbl["ranges"].items():
+                service[lo:hi] = [XL_SERVICES[code]] * (hi - lo)
+        ok = base > 0
+        return {"weights": weights.tolist(), "service": service, "zones": zones,
+                "base": np.where(ok, base, np.nan), "total": np.where(ok, base + surcharges, np.nan)}
+
+    def zones(self, zips, warehouses, zone_source):
+        return self._zones(zip_prefix(zips), _zip_keys(zips), self.warehouse_index(warehouses), zone_source)
+
+    def _zones(self, d, zip_keys, wh_idx, zone_source):
+        # calcZone: 5 位邮编有整表时直接取, 否则按 3 位前缀取 (无法解析的前缀在下标 1000)
+        pidx = np.where((d >= 0) & (d <= 999), d, 1000).astype(np.int64)
+        zone = self._zone_prefix[zone_source][wh_idx, pidx]
+        dense = self._zone_zip5[zone_source]
+        for i in np.unique(wh_idx):
+            if dense[i] is None: continue
+            rows = (wh_idx == i) & (zip_keys >= 0)
+            zone[rows] = dense[i][zip_keys[rows]]
+        # 邮编不足 3 位一律 Zone 8
+        return np.where(d == -1, 8, zone).astype(np.int64)
+
+    def das_codes(self, zips):
+        # 批量 DAS 类别编号, 对应 das_categories 的下标; 非 5 位纯数字邮编为 0
+        keys = _zip_keys(zips)
+        out = np.zeros(len(keys), dtype=np.uint8)
+        ok = keys >= 0
+        out[ok] = self._das_code[keys[ok]]
+        return out
+
+    def das_category(self, zip_code):
+        z = str(zip_code).strip()
+        if len(z) != 5 or not (z.isascii() and z.isdigit()): return None
+        return self.das_categories[self._das_code[int(z)]]
+
+    def _lookup(self, tbl, zone, wt, fallback_zone, svc=None):
+        # 第一个 w >= 计费重-0.001 的档位; 分区无价回退 fallback_zone
+        base = np.zeros(len(wt))
+        if tbl is None or len(tbl["w"]) == 0: return base
+        mat = tbl["mat"]
+        zone = np.clip(zone, 0, mat.shape[0] - 1)
+        if tbl["ranges"] is None:
+            segments = [(np.arange(len(wt)), 0, len(tbl["w"]))]
+        else:
+            segments = [(np.flatnonzero(svc == code), lo, hi) for code, (lo, hi) in tbl["ranges"].items()]
+        for rows, lo, hi in segments:
+            if len(rows) == 0: continue
+            i = lo + np.searchsorted(tbl["w"][lo:hi], wt[rows] - 0.001, side="left")
+            found = i < hi
+            rows, i = rows[found], i[found]
+            p = mat[zone[rows], i]
+            base[rows] = np.where(p != 0, p, mat[fallback_zone, i])
+        return base
+
+    def quote_batch(self, shipments, fuel_pct=None, channels=None):
+        """shipments: DataFrame 或 {列名: 数组}, 列见 SHIPMENT_COLUMNS (res 缺省 True, sig 缺省 False).
+        fuel_pct 可为标量或逐行数组; channels 限定只算部分渠道.
+        返回 {渠道: {zone, billable, service, base, surcharges, fuel, total}}, 不可用的行 total 为 NaN"""
+        p = self._prepare(shipments, fuel_pct)
+        whs, wh_inv = np.unique(_as_column(shipments, "warehouse", p["n"], "").astype(str), return_inverse=True)
+        return self._price(p, whs, wh_inv.reshape(-1), channels)
+
+    @staticmethod
+    def _measure(rows, n):
+        # 每件的规格校验/计费重/XL 服务, 与仓库和邮编无关
+        L = _as_column(rows, "L", n, 0).astype(np.float64)
+        W = _as_column(rows, "W", n, 0).astype(np.float64)
+        H = _as_column(rows, "H", n, 0).astype(np.float64)
+        Wt = _as_column(rows, "weight", n, 0).astype(np.float64)
+        dim_wt = (L * W * H) / DIM_DIVISOR
+        return {"L": L, "Wt": Wt, "comp": compliance(L, W, H, Wt),
+                "raw_wt": np.maximum(Wt, dim_wt), "xl_svc": xl_service_codes(L, W, H, Wt)}
+
+    def _prepare(self, shipments, fuel_pct):
+        # 与仓库无关的部分 (规格/计费重/邮编/等级) 只算一次, 比价时各仓库共用
+        n = len(np.asarray(shipments["zip"]))
+        tier = _as_column(shipments, "tier", n, "T3").astype(str)
+        # 邮编/等级只解析一次, 各渠道共享
+        zips = zip_strings(_as_column(shipments, "zip", n, ""))
+        tiers, tier_idx = np.unique(tier, return_inverse=True)
+        return dict(
+            self._measure(shipments, n), n=n,
+            res=_as_column(shipments, "res", n, True).astype(bool),
+            sig=_as_column(shipments, "sig", n, False).astype(bool),
+            fuel_rate=np.asarray(self.default_fuel_pct() if fuel_pct is None else fuel_pct, dtype=np.float64) / 100,
+            prefix=zip_prefix(zips, True), zip_keys=_zip_keys(zips, True),
+            tiers=tiers, tier_rows=[tier_idx.reshape(-1) == k for k in range(len(tiers))],
+        )
+
+    def _price(self, p, whs, wh_inv, channels=None):
+        # whs: 去重后的仓库, wh_inv: 每行在 whs 中的下标; 仓库相关的判断只对去重值做
+        n, L, Wt, comp, raw_wt, xl_svc = p["n"], p["L"], p["Wt"], p["comp"], p["raw_wt"], p["xl_svc"]
+        tiers = p["tiers"]
+        wh_idx = self.warehouse_index(whs)[wh_inv]
+        # 多件货整票共用一个目的地, 分区已按票算好 (见 quote_pieces)
+        zone_cache = dict(p.get("zones") or {})
+
+        out = {}
+        for ch, conf in self.channels.items():
+            if channels is not None and ch not in channels: continue
+            ok = np.isin(whs, conf["allow_wh"])[wh_inv]
+            if "UNIUNI" in ch: ok &= ~comp["uniuni"]
+            if "USPS" in ch: ok &= ~comp["usps"]
+            if "XLmiles" in ch: ok &= ~comp["xl"]
+            if "FedEx" in ch and "超大" not in ch: ok &= ~((Wt > 150) | (L > 108))
+
+            is_xl = "XLmiles" in ch
+            billable = raw_wt if is_xl else np.ceil(raw_wt)
+            src = conf["zone_source"]
+            if src not in zone_cache: zone_cache[src] = self._zones(p["prefix"], p["zip_keys"], wh_idx, src)
+            zone = zone_cache[src]
+
+            base = np.zeros(n)
+            for k, in_tier in enumerate(p["tier_rows"]):
+                rows = np.flatnonzero(ok & in_tier)
+                if len(rows) == 0: continue
+                tbl = self.tables.get(tiers[k], {}).get(ch)
+                base[rows] = self._lookup(tbl, zone[rows], billable[rows], 6 if is_xl else 8,
+                                          xl_svc[rows] if is_xl else None)
+            ok &= base > 0
+
+            # 附加费与燃油的累加顺序与页面一致, 保证逐分相同
+            fees = conf["fees"]
+            surcharges = np.zeros(n)
+            if fees["res"] > 0: surcharges = surcharges + np.where(p["res"], fees["res"], 0.0)
+            if fees["sig"] > 0: surcharges = surcharges + np.where(p["sig"], fees["sig"], 0.0)
+            fuel = np.zeros(n)
+            if conf["fuel_mode"] not in ("none", "included"):
+                rate = p["fuel_rate"] * 0.85 if conf["fuel_mode"] == "discount_85" else p["fuel_rate"]
+                fuel = (base + surcharges) * rate
+                surcharges = surcharges + fuel
+            total = np.where(ok, base + surcharges, np.nan)
+
+            out[ch] = {
+                "zone": zone, "billable": billable,
+                "service": np.where(xl_svc >= 0, np.array(XL_SERVICES, dtype=object)[np.maximum(xl_svc, 0)], None) if is_xl else None,
+                "base": np.where(ok, base, np.nan), "surcharges": np.where(ok, surcharges, np.nan),
+                "fuel": np.where(ok, fuel, np.nan), "total": total,
+            }
+        return out
+
+    def quote_pieces(self, warehouse, tier, zip_code, pieces, res=True, sig=False, fuel_pct=None, channels=None):
+        """多件货整票报价: pieces 为 DataFrame 或 {L, W, H, weight[, qty]} 列, qty 为同规格箱数 (缺省 1).
+        各件的计费重/规格/XL 服务一次向量化算出; 分区与 DAS 按整票只查一次 (locate). 住宅/签名费按箱计.
+        返回 {zones, das, gofo, qty, compliance, channels: {渠道: 各件 zone/billable/service/base/surcharges/fuel/total
+        + shipment 整票合计}}; 整票只走一个渠道, 任一件在该渠道不可用则整票 total 为 NaN"""
+        n = len(np.asarray(pieces["weight"]))
+        qty = _as_column(pieces, "qty", n, 1).astype(np.int64)
+        warehouse = str(warehouse)
+        loc = self.locate(warehouse, zip_code)
+        p = dict(
+            self._measure(pieces, n), n=n,
+            res=np.full(n, bool(res)), sig=np.full(n, bool(sig)),
+            fuel_rate=np.asarray(self.default_fuel_pct() if fuel_pct is None else fuel_pct, dtype=np.float64) / 100,
+            zones={src: np.full(n, z, dtype=np.int64) for src, z in loc["zones"].items()},
+            tiers=np.array([str(tier)]), tier_rows=[np.ones(n, dtype=bool)],
+        )
+        out = {}
+        for ch, r in self._price(p, np.array([warehouse]), np.zeros(n, dtype=np.int64), channels).items():
+            # 与页面逐箱累加的顺序一致
+            ok = n > 0 and not np.isnan(r["total"]).any()
+            weights = qty.tolist()
+            shipment = {k: sum(q * v for q, v in zip(weights, r[k].tolist())) if ok else math.nan
+                        for k in ("billable", "base", "surcharges", "fuel", "total")}
+            shipment["pieces"] = int(qty.sum())
+            out[ch] = dict(r, zone=loc["zones"][self.channels[ch]["zone_source"]], shipment=shipment)
+        return {"zones": loc["zones"], "das": loc["das"], "gofo": loc["gofo"], "qty": qty,
+                "compliance": p["comp"], "channels": out}
+
+    def quote_shipment(self, warehouse, tier, zip_code, pieces, res=True, sig=False, fuel_pct=None):
+        """多件货整票报价的结果行 (同 quote, 附 pieces 明细), 只含整票可用的渠道, 渠道顺序同 CHANNEL_CONFIG"""
+        r = self.quote_pieces(warehouse, tier, zip_code, pieces, res=res, sig=sig, fuel_pct=fuel_pct)
+        qty = r["qty"].tolist()
+        rows = []
+        for ch, v in r["channels"].items():
+            total = v["shipment"]["total"]
+            if math.isnan(total): continue
+            services = v["service"].tolist() if v["service"] is not None else [None] * len(qty)
+            rows.append({
+                "channel": ch, "zone": v["zone"], "pieces": v["shipment"]["pieces"],
+                "billable": v["shipment"]["billable"], "base": v["shipment"]["base"],
+                "surcharges": v["shipment"]["surcharges"], "fuel": v["shipment"]["fuel"], "total": total,
+                "lines": [{"qty": q, "billable": b, "service": svc, "total": t}
+                          for q, b, svc, t in zip(qty, v["billable"].tolist(), services, v["total"].tolist())],
+            })
+        return rows
+
+    def rate_shop_batch(self, shipments, fuel_pct=None, warehouses=None, channels=None, top=3):
+        """整批多仓比价: 每票对所有 (仓库, 渠道) 组合计价, 取总费用最低的前 top 个.
+        shipments 同 quote_batch (warehouse 列忽略); warehouses/channels 限定参与比价的范围.
+        返回 {warehouse, channel, zone, billable, total}, 每列形状 (n, top), 可用组合不足时为 None/NaN"""
+        p = self._prepare(shipments, fuel_pct)
+        n = p["n"]
+        combos = []
+        best = {"total": np.full((n, top), np.nan), "combo": np.full((n, top), -1),
+                "zone": np.zeros((n, top), dtype=np.int64), "billable": np.full((n, top), np.nan)}
+        # 仓库按代码排序后依次合并: 同价时仓库代码小的在前, 与 rate_shop 及页面比价一致
+        for wh in sorted(self.warehouses if warehouses is None else warehouses):
+            allowed = [ch for ch, conf in self.channels.items()
+                       if wh in conf["allow_wh"] and (channels is None or ch in channels)]
+            if not allowed: continue
+            cand = {k: [v] for k, v in best.items()}
+            for ch, r in self._price(p, np.array([wh]), np.zeros(n, dtype=np.int64), allowed).items():
+                if np.isnan(r["total"]).all(): continue
+                combos.append((wh, ch))
+                cand["combo"].append(np.full(n, len(combos) - 1))
+                for k in ("total", "zone", "billable"): cand[k].append(r[k])
+            if len(cand["total"]) == 1: continue
+            # 每个仓库的各渠道与当前前 top 名一起重排一次; 稳定排序使同价时先合并的在前, NaN 排在最后
+            order = np.argsort(np.column_stack(cand["total"]), axis=1, kind="stable")[:, :top]
+            for k in best:
+                best[k] = np.take_along_axis(np.column_stack(cand[k]), order, axis=1)
+
+        valid = best["combo"] >= 0
+        labels = np.array(combos + [(None, None)], dtype=object)
+        picked = labels[np.where(valid, best["combo"], len(combos))]
+        return {"warehouse": picked[..., 0], "channel": picked[..., 1],
+                "zone": np.where(valid, best["zone"], 0), "billable": best["billable"], "total": best["total"]}
+
+    def rate_shop(self, tier, zip_code, L, W, H, weight, res=True, sig=False, fuel_pct=None, warehouses=None):
+        """单票多仓比价: 各仓库的 quote() 结果 (附 warehouse) 按总费用从低到高排序, 同价按仓库代码、渠道顺序"""
+        rows = []
+        for wh in sorted(self.warehouses if warehouses is None else warehouses):
+            for r in self.quote(wh, tier, zip_code, L, W, H, weight, res=res, sig=sig, fuel_pct=fuel_pct):
+                r["warehouse"] = wh
+                rows.append(r)
+        rows.sort(key=lambda r: r["total"])
+        return rows
+
+    def locate(self, warehouse, zip_code):
+        # (仓库, 邮编) -> 各分区来源的 Zone / GOFO 信息 / DAS 偏远; 结果放在实例级 LRU 缓存里
+        return self._locate_cached(str(warehouse), str(zip_code).strip())
+
+    def locate_cache_info(self):
+        return self._locate_cached.cache_info()._asdict()
+
+    def _locate(self, warehouse, zip_code):
+        z = zip_strings([zip_code])
+        prefix, keys, wh_idx = zip_prefix(z, True), _zip_keys(z, True), self.warehouse_index([warehouse])
+        zones = {src: int(self._zones(prefix, keys, wh_idx, src)[0]) for src in ZONE_SOURCES}
+        return {"zones": zones, "gofo": self.gofo_info(zip_code), "das": self.das_category(zip_code)}
+
+    def gofo_info(self, zip_code):
+        # GOFO 邮编库查询, 二分查找有序邮编; 返回与页面显示相同的 city/state/region/cn_state
+        z = str(zip_code).strip()
+        if len(z) != 5 or not (z.isascii() and z.isdigit()): return None
+        g = self._gofo
+        i = int(np.searchsorted(g["zip"], int(z)))
+        if i >= len(g["zip"]) or g["zip"][i] != int(z): return None
+        s = g["state"][i]
+        return {"city": g["cities"][g["city"][i]], "state": g["states"][s],
+                "region": g["regions"][g["region"][i]], "cn_state": g["states_cn"][s]}
+
+    def quote(self, warehouse, tier, zip_code, L, W, H, weight, res=True, sig=False, fuel_pct=None):
+        """单票报价 (纯 Python 标量路径, 低延迟), 返回页面结果表中的各行, 渠道顺序同 CHANNEL_CONFIG"""
+        L, W, H, Wt = float(L), float(W), float(H), float(weight)
+        loc = self.locate(warehouse, zip_code)
+        fuel_rate = (self.default_fuel_pct() if fuel_pct is None else float(fuel_pct)) / 100
+        dims = sorted((L, W, H), reverse=True)
+        max_l, girth = dims[0], dims[0] + 2 * (dims[1] + dims[2])
+        comp = {"uniuni": Wt > 20 or max_l > 20, "usps": Wt > 70 or girth > 130,
+                "xl": Wt > 200 or max_l > 144 or girth > 225}
+        raw_wt = max(Wt, (L * W * H) / DIM_DIVISOR)
+        warehouse = str(warehouse)
+
+        rows = []
+        for ch, conf in self.channels.items():
+            if warehouse not in conf["allow_wh"]: continue
+            if "UNIUNI" in ch and comp["uniuni"]: continue
+            if "USPS" in ch and comp["usps"]: continue
+            if "XLmiles" in ch and comp["xl"]: continue
+            if "FedEx" in ch and "超大" not in ch and (Wt > 150 or L > 108): continue
+
+            is_xl = "XLmiles" in ch
+            billable = raw_wt if is_xl else float(math.ceil(raw_wt))
+            zone = loc["zones"][conf["zone_source"]]
+            tbl = self.tables.get(tier, {}).get(ch)
+            service = None
+            if is_xl:
+                code = _xl_service(max_l, girth, Wt)
+                service = XL_SERVICES[code] if code >= 0 else None
+                base = self._lookup_one(tbl, zone, billable, 6, code)
+            else:
+                base = self._lookup_one(tbl, zone, billable, 8)
+            if base <= 0: continue
+
+            fees = conf["fees"]
+            surcharges, details = 0, []
+            if res and fees["res"] > 0:
+                surcharges += fees["res"]
+                details.append(f"住宅 ${_js_num(fees['res'])}")
+            if sig and fees["sig"] > 0:
+                surcharges += fees["sig"]
+                details.append(f"签名 ${_js_num(fees['sig'])}")
+            fuel = 0.0
+            if conf["fuel_mode"] not in ("none", "included"):
+                rate = fuel_rate * 0.85 if conf["fuel_mode"] == "discount_85" else fuel_rate
+                tag = " (85折)" if conf["fuel_mode"] == "discount_85" else ""
+                fuel = (base + surcharges) * rate
+                surcharges += fuel
+                details.append(f"燃油{tag} {rate * 100:.2f}%: ${fuel:.2f}")
+            elif conf["fuel_mode"] == "included":
+                details.append("燃油: 已含")
+
+            rows.append({
+                "channel": ch, "zone": zone, "billable": billable, "service": service,
+                "base": base, "surcharges": surcharges, "fuel": fuel, "total": base + surcharges,
+                "details": details,
+            })
+        return rows
+
+    def _lookup_one(self, tbl, zone, wt, fallback_zone, svc=None):
+        if tbl is None: return 0.0
+        lo, hi = 0, len(tbl["w_list"])
+        if tbl["ranges"] is not None:
+            if svc not in tbl["ranges"]: return 0.0
+            lo, hi = tbl["ranges"][svc]
+        i = bisect.bisect_left(tbl["w_list"], wt - 0.001, lo, hi)
+        if i >= hi: return 0.0
+        rows = tbl["rows"]
+        p = rows[zone][i] if 0 <= zone < len(rows) else 0.0
+        return p or rows[fallback_zone][i]
+
+def _xl_service(max_l, girth, Wt):
+    if max_l <= 96 and girth <= 130 and Wt <= 150: return 0
+    if max_l <= 108 and girth <= 165 and Wt <= 150: return 1
+    if max_l <= 144 and girth <= 225 and Wt <= 200: return 2
+    return -1
+
+def _js_num(x):
+    # 与 JS 模板字符串中数字的默认格式一致 (2.0 -> "2", 10.20 -> "10.2")
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+
+# ==========================================
+# 二进制价格库 (generate.write_rate_store): 数组以只读 memmap 打开, 零拷贝, 多进程共享同一份页缓存
+# ==========================================
+RATE_STORE_VERSION = 2
+
+class RateStore:
+    """全部等级×渠道价格表: weight (n,), price (n, 分区数), service (n,) uint8, table_id (n,) 行所属表下标;
+    带日期的发布另有区间索引 (index["versions"]), 按发货日期取表"""
+
+    def __init__(self, path="rate_store"):
+        with open(os.path.join(path, "index.json"), encoding="utf-8") as f:
+            self.index = json.load(f)
+        if self.index.get("version") != RATE_STORE_VERSION:
+            raise ValueError(f"Unsupported rate store version {self.index.get('version')} in {path}, rebuild it with generate.py")
+        arrays = {name: np.load(os.path.join(path, fname), mmap_mode="r", allow_pickle=False)
+                  for name, fname in self.index["arrays"].items()}
+        self.weight, self.price = arrays["weight"], arrays["price"]
+        self.service, self.table_id = arrays["service"], arrays["table_id"]
+        self.tables = self.index["tables"]
+        # 只属于某个发布的表带 "release", 不参与当前价格的查找
+        self._by_key = {(t["tier"], t["channel"]): t for t in self.tables if "release" not in t}
+        versions = self.index.get("versions") or {}
+        self.releases = versions.get("releases", [])
+        self._intervals = interval_lists(versions.get("intervals"))
+
+    def table(self, tier, channel, service=None, as_of=None):
+        # 某等级某渠道的行切片 (仍是 memmap 视图); service 为 XLmiles 服务名时只取该服务的行
+        # as_of: 发货日期, 取当日适用的发布中的表; 没有发布覆盖时同当前价格
+        t = self._by_key.get((tier, channel))
+        if as_of is not None:
+            tid = table_as_of(self._intervals, (tier, channel), int(to_days(as_of)))
+            if tid >= 0: t = self.tables[tid]
+        if t is None: raise KeyError((tier, channel))
+        lo, hi = t["offset"], t["offset"] + t["rows"]
+        if service is not None:
+            start, stop = t.get("services", {}).get(service, (0, 0))
+            lo, hi = t["offset"] + start, t["offset"] + stop
+        return {"w": self.weight[lo:hi], "price": self.price[lo:hi], "fuel_rate": t["fuel_rate"]}
+
+    def lookup(self, tier, channel, zones, weights, service=None, as_of=None):
+        # 向量化查价, 与 QuoteEngine._lookup 相同: 第一个 w >= 计费重-0.001 的档位, 无该档返回 NaN (不做分区回退)
+        t = self.table(tier, channel, service, as_of)
+        wt = np.asarray(weights, dtype=np.float64)
+        zones = np.clip(np.asarray(zones, dtype=np.int64), 0, self.price.shape[1] - 1)
+        i = np.searchsorted(t["w"], wt - 0.001, side="left")
+        found = i < len(t["w"])
+        out = np.full(len(wt), np.nan)
+        out[found] = t["price"][i[found], zones[found]]
+        return out